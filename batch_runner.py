@@ -0,0 +1,259 @@
+"""
+Batch combines for File Combiner
+Runs many combine jobs described in a JSON jobs file across a process pool
+and writes a summary report with per-job timings and byte counts:
+
+    python -m file_combiner batch jobs.json -p 8 --io-limit 2 --report report.json
+
+The jobs file is either a list of jobs or an object with "defaults" applied
+to every job and a "jobs" list. Relative paths are resolved against the
+directory of the jobs file:
+
+    {
+        "defaults": {"include": ["*.py", "*.md"], "max_file_kb": 256},
+        "jobs": [
+            {"root": "repos/api", "output": "out/api.txt"},
+            {"root": "repos/web", "output": "out/web.txt.gz", "exclude": ["dist"]}
+        ]
+    }
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import combine_engine
+import output_writer
+from path_filter import PathFilter
+
+# Keys a job may set, with their defaults. They mirror the command line options.
+JOB_OPTIONS = {
+    'name': None,
+    'root': None,
+    'output': None,
+    'include': [],
+    'exclude': [],
+    'gitignore': True,
+    'workers': 0,
+    'max_file_kb': None,
+    'max_file_lines': None,
+    'max_total_mb': None,
+    'compress': None,
+    'shard_mb': None,
+    'index': False,
+    'incremental': False,
+    'resume': False,
+    'dedup': False,
+    'stats': False,
+    'ignore': [],
+}
+
+# Semaphore limiting how many jobs copy file contents at the same time,
+# set in each worker process by _init_worker
+_io_slots = None
+
+
+def load_jobs(jobs_file):
+    """Read a jobs file and return the jobs with defaults applied and paths resolved"""
+    with open(jobs_file, 'r', encoding='utf-8') as f:
+        spec = json.load(f)
+    if isinstance(spec, list):
+        spec = {'jobs': spec}
+
+    base = os.path.dirname(os.path.abspath(jobs_file))
+    defaults = spec.get('defaults', {})
+    jobs = []
+    for i, entry in enumerate(spec.get('jobs', [])):
+        job = dict(JOB_OPTIONS)
+        job.update(defaults)
+        job.update(entry)
+        unknown = set(job) - set(JOB_OPTIONS)
+        if unknown:
+            raise ValueError(f"Job {i + 1}: unknown option(s) {', '.join(sorted(unknown))}")
+        if not job['root'] or not job['output']:
+            raise ValueError(f"Job {i + 1}: 'root' and 'output' are required")
+        job['root'] = os.path.normpath(os.path.join(base, job['root']))
+        job['output'] = os.path.normpath(os.path.join(base, job['output']))
+        job['ignore'] = [os.path.normpath(os.path.join(base, path)) for path in job['ignore']]
+        if job['name'] is None:
+            job['name'] = os.path.basename(job['output'])
+        jobs.append(job)
+    return jobs
+
+
+def _init_worker(io_slots):
+    global _io_slots
+    _io_slots = io_slots
+
+
+def run_job(job):
+    """Run one job and return its report entry. Errors are reported, not raised."""
+    result = {
+        'name': job['name'],
+        'root': job['root'],
+        'output': job['output'],
+        'status': 'ok',
+        'files': 0,
+        'input_bytes': 0,
+        'output_bytes': 0,
+        'outputs': [],
+        'duplicates': 0,
+        'lines': 0,
+        'tokens': 0,
+        'scan_seconds': 0.0,
+        'io_wait_seconds': 0.0,
+        'combine_seconds': 0.0,
+        'seconds': 0.0,
+    }
+    start = time.perf_counter()
+    try:
+        if not os.path.isdir(job['root']):
+            raise ValueError(f"Root directory not found: {job['root']}")
+        path_filter = PathFilter(job['root'], include=job['include'], exclude=job['exclude'],
+                                 use_gitignore=job['gitignore'])
+        ignore = combine_engine.output_paths(job['output']) + [os.path.abspath(path) for path in job['ignore']]
+        files = combine_engine.collect_files(job['root'], path_filter=path_filter, ignore=ignore)
+        if not files:
+            raise ValueError("No files matched")
+        budget = None
+        if job['max_file_kb'] is not None or job['max_file_lines'] is not None or job['max_total_mb'] is not None:
+            budget = combine_engine.OutputBudget(
+                max_file_bytes=job['max_file_kb'] * 1024 if job['max_file_kb'] is not None else None,
+                max_file_lines=job['max_file_lines'],
+                max_total_bytes=job['max_total_mb'] * 1024 * 1024 if job['max_total_mb'] is not None else None,
+            )
+        estimate = combine_engine.plan_output(files, budget)
+        result['files'] = len(files)
+        result['input_bytes'] = estimate.input_bytes
+        result['scan_seconds'] = time.perf_counter() - start
+
+        output_dir = os.path.dirname(job['output'])
+        if output_dir:
+            os.makedirs(output_dir, exist_ok=True)
+        combiner = combine_engine.Combiner(
+            job['root'], files, job['output'],
+            workers=job['workers'],
+            # The DIRECTORY STRUCTURE shows the whole tree, not only the included files
+            snapshot=combine_engine.DirectorySnapshot(
+                PathFilter(job['root'], exclude=job['exclude'], use_gitignore=job['gitignore'])),
+            incremental=job['incremental'],
+            budget=budget, estimate=estimate,
+            compression=job['compress'] or output_writer.compression_for(job['output']),
+            shard_bytes=job['shard_mb'] * 1024 * 1024 if job['shard_mb'] is not None else None,
+            index=job['index'], resumable=job['resume'], dedup=job['dedup'], stats=job['stats'])
+
+        waited = time.perf_counter()
+        if _io_slots is not None:
+            _io_slots.acquire()
+        try:
+            combine_start = time.perf_counter()
+            result['io_wait_seconds'] = combine_start - waited
+            combiner.run()
+            result['combine_seconds'] = time.perf_counter() - combine_start
+        finally:
+            if _io_slots is not None:
+                _io_slots.release()
+
+        result['outputs'] = combiner.outputs
+        result['duplicates'] = combiner.duplicates
+        result['lines'] = combiner.total_stats.lines
+        result['tokens'] = combiner.total_stats.tokens
+        result['output_bytes'] = sum(os.path.getsize(path) for path in combiner.outputs)
+    except Exception as e:
+        result['status'] = 'error'
+        result['error'] = str(e)
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def run_batch(jobs, processes=None, io_limit=None, on_result=None):
+    """
+    Run jobs on a pool of processes and return their results in job order.
+    io_limit caps how many jobs copy file contents at once; scanning and
+    planning are not limited. processes=0 runs the jobs in this process.
+    on_result is called with each result as it finishes.
+    """
+    results = [None] * len(jobs)
+    if processes == 0:
+        for i, job in enumerate(jobs):
+            results[i] = run_job(job)
+            if on_result is not None:
+                on_result(results[i])
+        return results
+
+    io_slots = multiprocessing.Semaphore(io_limit) if io_limit else None
+    with ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(io_slots,)) as pool:
+        futures = {pool.submit(run_job, job): i for i, job in enumerate(jobs)}
+        for future in as_completed(futures):
+            results[futures[future]] = future.result()
+            if on_result is not None:
+                on_result(future.result())
+    return results
+
+
+def summarize(results, seconds):
+    """Return the report written by --report"""
+    ok = [result for result in results if result['status'] == 'ok']
+    return {
+        'jobs': len(results),
+        'succeeded': len(ok),
+        'failed': len(results) - len(ok),
+        'files': sum(result['files'] for result in ok),
+        'input_bytes': sum(result['input_bytes'] for result in ok),
+        'output_bytes': sum(result['output_bytes'] for result in ok),
+        'seconds': seconds,
+        'results': results,
+    }
+
+
+def build_parser():
+    """Create the parser for the batch command"""
+    parser = argparse.ArgumentParser(
+        prog="file_combiner batch",
+        description="Run the combine jobs listed in a JSON jobs file in parallel."
+    )
+    parser.add_argument("jobs_file", help="JSON file listing the jobs")
+    parser.add_argument("-p", "--processes", type=int, default=os.cpu_count(),
+                        help="Number of jobs run at the same time, 0 to run in this process (default: %(default)s)")
+    parser.add_argument("--io-limit", type=int, metavar="N",
+                        help="At most N jobs copy file contents at the same time (default: no limit)")
+    parser.add_argument("--report", metavar="FILE", help="Write a JSON report of all jobs to FILE")
+    return parser
+
+
+def main(argv):
+    """Run a batch from the command line and return an exit code"""
+    args = build_parser().parse_args(argv)
+    try:
+        jobs = load_jobs(args.jobs_file)
+    except (OSError, ValueError) as e:
+        print(f"Cannot read {args.jobs_file}: {e}", file=sys.stderr)
+        return 2
+
+    def report_progress(result):
+        if result['status'] == 'ok':
+            print(f"{result['name']}: {result['files']} files, "
+                  f"{combine_engine.format_size(result['output_bytes'])} in {result['seconds']:.2f} s")
+        else:
+            print(f"{result['name']}: FAILED: {result['error']}", file=sys.stderr)
+
+    if args.report:
+        # The report may be written inside one of the roots
+        for job in jobs:
+            job['ignore'].append(os.path.abspath(args.report))
+
+    start = time.perf_counter()
+    results = run_batch(jobs, args.processes, args.io_limit, report_progress)
+    summary = summarize(results, time.perf_counter() - start)
+
+    print(f"{summary['succeeded']} of {summary['jobs']} jobs succeeded: {summary['files']} files, "
+          f"{combine_engine.format_size(summary['input_bytes'])} input, "
+          f"{combine_engine.format_size(summary['output_bytes'])} output in {summary['seconds']:.2f} s")
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2)
+    return 1 if summary['failed'] else 0
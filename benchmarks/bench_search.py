@@ -0,0 +1,87 @@
+"""
+Micro-benchmark for the path index behind the GUI filter
+Builds the index in scan-sized batches for 100k and 1M paths, then times
+substring, glob and fuzzy queries the way the filter runs them (first 1000
+matches), a plain loop over all paths for comparison, and the unlimited
+search behind "Add All Matches".
+
+    python benchmarks/bench_search.py
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from path_index import PathIndex  # noqa: E402
+
+ROOT = "/repo"
+WORDS = ["src", "lib", "core", "utils", "tests", "api", "models", "views", "components", "internal",
+         "vendor", "pkg", "cmd", "docs", "assets"]
+EXTENSIONS = ["py", "js", "go", "md", "txt"]
+
+QUERIES = [
+    ("substring", "models/views"),
+    ("substring", "file_99999_"),
+    ("substring", "no-such-path"),
+    ("glob", "*.md"),
+    ("glob", "src/*/file_1*.go"),
+    ("fuzzy", "mdvfile9"),
+    ("fuzzy", "zzq"),
+]
+
+
+def make_paths(count):
+    rng = random.Random(1)
+    paths = []
+    for i in range(count):
+        directory = "/".join(rng.choice(WORDS) for _ in range(rng.randrange(1, 6)))
+        paths.append(f"{ROOT}/{directory}/file_{i}_{rng.choice(WORDS)}.{rng.choice(EXTENSIONS)}")
+    return paths
+
+
+def timed(func, *args):
+    # Best of three
+    best = None
+    for _ in range(3):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100_000, 1_000_000])
+    parser.add_argument("--limit", type=int, default=1000, help="Matches shown by the filter")
+    args = parser.parse_args()
+
+    for size in args.sizes:
+        paths = make_paths(size)
+        start = time.perf_counter()
+        index = PathIndex(ROOT)
+        for i in range(0, size, 500):
+            index.add(paths[i:i + 500])
+        print(f"{size} paths, index built in {time.perf_counter() - start:.2f} s")
+
+        print(f"{'mode':>10} {'query':>18} {'matches':>8} {'index ms':>9} {'loop ms':>8}")
+        for mode, query in QUERIES:
+            seconds, matches = timed(index.search, query, mode, args.limit)
+            loop = ""
+            if mode == "substring":
+                # What a filter over the plain path list costs
+                loop_seconds, _ = timed(lambda: [p for p in paths if query in p.lower()][:args.limit])
+                loop = f"{loop_seconds * 1000:.1f}"
+            print(f"{mode:>10} {query:>18} {len(matches):>8} {seconds * 1000:>9.1f} {loop:>8}")
+
+        seconds, matches = timed(index.search, "*.md", "glob", None)
+        print(f"{'all':>10} {'*.md':>18} {len(matches):>8} {seconds * 1000:>9.1f}")
+        print()
+
+
+if __name__ == "__main__":
+    main()
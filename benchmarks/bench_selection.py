@@ -0,0 +1,78 @@
+"""
+Micro-benchmark for the selection model
+Times adding (with duplicates) and removing paths for 10k, 100k and 1M
+entries, and compares against the plain list the GUI used before for the
+sizes where that finishes in reasonable time.
+
+    python benchmarks/bench_selection.py
+"""
+
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from selection_model import SelectionModel  # noqa: E402
+
+
+def make_paths(count):
+    return [f"/repo/src/pkg{i % 1000}/module_{i}.py" for i in range(count)]
+
+
+def bench_model(paths):
+    start = time.perf_counter()
+    model = SelectionModel()
+    model.extend(paths)
+    model.extend(paths)  # Second pass is all duplicates
+    added = time.perf_counter() - start
+
+    # Remove every other row, like a large listbox multi-selection
+    start = time.perf_counter()
+    model.remove_rows(range(0, len(paths), 2))
+    removed_rows = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for path in paths[1::2]:
+        model.discard(path)
+    removed_paths = time.perf_counter() - start
+    return added, removed_rows + removed_paths
+
+
+def bench_list(paths):
+    start = time.perf_counter()
+    selected = []
+    for _ in range(2):
+        for path in paths:
+            if path not in selected:
+                selected.append(path)
+    added = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for path in paths:
+        if path in selected:
+            selected.remove(path)
+    removed = time.perf_counter() - start
+    return added, removed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--list-limit", type=int, default=10_000,
+                        help="Largest size also timed with a plain list (quadratic)")
+    args = parser.parse_args()
+
+    print(f"{'paths':>10} {'impl':>8} {'add s':>10} {'remove s':>10}")
+    for size in args.sizes:
+        paths = make_paths(size)
+        added, removed = bench_model(paths)
+        print(f"{size:>10} {'model':>8} {added:>10.4f} {removed:>10.4f}")
+        if size <= args.list_limit:
+            added, removed = bench_list(paths)
+            print(f"{size:>10} {'list':>8} {added:>10.4f} {removed:>10.4f}")
+
+
+if __name__ == "__main__":
+    main()
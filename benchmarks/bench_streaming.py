@@ -0,0 +1,80 @@
+"""
+Benchmark for the streaming copy in combine_engine
+Generates a synthetic input set, combines it in a child process and reports
+peak RSS and throughput. Peak RSS should stay flat as the input size grows.
+
+    python benchmarks/bench_streaming.py --size-gb 5 --files 10
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Run inside the child process so its peak RSS is not affected by the generator
+CHILD_SCRIPT = """
+import sys, json, time, resource
+sys.path.insert(0, sys.argv[1])
+import combine_engine
+root, output = sys.argv[2], sys.argv[3]
+files = combine_engine.collect_files(root)
+start = time.perf_counter()
+combine_engine.combine_files(root, files, output)
+elapsed = time.perf_counter() - start
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if sys.platform == "darwin":
+    rss //= 1024  # bytes on macOS, kilobytes elsewhere
+print(json.dumps({"seconds": elapsed, "peak_rss_kb": rss}))
+"""
+
+
+def generate_input(directory, total_bytes, file_count):
+    """Write file_count UTF-8 files adding up to total_bytes"""
+    line = ("The quick brown fox jumps over the lazy dog. åäö ✓\n").encode('utf-8')
+    block = line * (1024 * 1024 // len(line))
+    per_file = total_bytes // file_count
+    for i in range(file_count):
+        with open(os.path.join(directory, f"input_{i:04d}.txt"), 'wb') as f:
+            written = 0
+            while written < per_file:
+                piece = block[:per_file - written]
+                f.write(piece)
+                written += len(piece)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size-gb", type=float, default=5.0, help="Total input size in GB")
+    parser.add_argument("--files", type=int, default=10, help="Number of input files")
+    parser.add_argument("--dir", help="Directory for the synthetic data (default: a temp dir)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        root = os.path.join(tmp, "input")
+        os.makedirs(root)
+        total_bytes = int(args.size_gb * 1024 ** 3)
+        print(f"Generating {args.size_gb} GB in {args.files} files...")
+        generate_input(root, total_bytes, args.files)
+
+        output = os.path.join(tmp, "combined.txt")
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, "-c", CHILD_SCRIPT, REPO_ROOT, root, output],
+                                check=True, capture_output=True, text=True)
+        wall = time.perf_counter() - start
+
+        stats = json.loads(result.stdout)
+        mb = total_bytes / (1024 * 1024)
+        print(f"Input:     {mb:.0f} MB")
+        print(f"Output:    {os.path.getsize(output) / (1024 * 1024):.0f} MB")
+        print(f"Combine:   {stats['seconds']:.2f} s ({mb / stats['seconds']:.1f} MB/s)")
+        print(f"Wall:      {wall:.2f} s")
+        print(f"Peak RSS:  {stats['peak_rss_kb'] / 1024:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
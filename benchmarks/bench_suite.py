@@ -0,0 +1,325 @@
+"""
+Benchmark suite for scanning, header generation and combining
+Generates reproducible synthetic trees (wide, deep, many tiny files, a few
+huge files, mixed binary/latin-1/CRLF content) and times, in a fresh child
+process per run, the engine work behind the GUI:
+
+    scan_tree   directory listing done by populate_tree (recursive load)
+    scan_files  file walk done by add_directory_files
+    header      index, DIRECTORY STRUCTURE and table of contents
+                (_generate_tree_view and write_header)
+    combine     plan_output and combine_files as _combine_files_task runs them
+
+Results are written as JSON. With --baseline the run is compared against an
+earlier result file and the exit code is 1 if any case got slower or used
+more memory than the tolerance allows:
+
+    python benchmarks/bench_suite.py --output baseline.json
+    python benchmarks/bench_suite.py --output current.json --baseline baseline.json
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import datetime
+import platform
+import tempfile
+import subprocess
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+RESULTS_VERSION = 1
+
+# Fixed seed and mtime so every run generates the same trees
+SEED = 1234
+TREE_MTIME = 1_600_000_000
+
+# Timed phases, in the order they run
+PHASES = ("scan_tree", "scan_files", "header", "combine")
+
+# Differences below this are noise, whatever the tolerance
+NOISE_SECONDS = 0.02
+
+WORDS = ("def", "class", "return", "value", "self", "import", "for", "in", "if", "else",
+         "data", "path", "result", "index", "None", "True", "print", "config", "user", "item")
+
+
+def _text_lines(rng, count):
+    lines = []
+    for _ in range(count):
+        indent = "    " * rng.randrange(4)
+        lines.append(indent + " ".join(rng.choice(WORDS) for _ in range(rng.randrange(2, 12))))
+    return lines
+
+
+def _text(rng, size, newline="\n"):
+    """Return roughly size bytes of ASCII source-like text"""
+    pool = _text_lines(rng, 200)
+    parts = []
+    total = 0
+    while total < size:
+        line = rng.choice(pool) + newline
+        parts.append(line)
+        total += len(line)
+    return "".join(parts).encode('ascii')
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def gen_wide(root, rng, scale):
+    """Many entries per directory: a crowded root and a few hundred flat packages"""
+    for i in range(int(3000 * scale)):
+        _write(os.path.join(root, f"module_{i:05d}.py"), _text(rng, rng.randrange(200, 4000)))
+    for d in range(int(300 * scale)):
+        for i in range(20):
+            _write(os.path.join(root, f"pkg_{d:04d}", f"file_{i:02d}.py"), _text(rng, rng.randrange(200, 4000)))
+
+
+def gen_deep(root, rng, scale):
+    """Long chains of nested directories with a couple of files per level"""
+    for chain in range(int(20 * scale)):
+        path = os.path.join(root, f"chain_{chain:02d}")
+        for level in range(150):
+            path = os.path.join(path, f"level_{level:03d}")
+            for i in range(2):
+                _write(os.path.join(path, f"file_{i}.txt"), _text(rng, rng.randrange(100, 1000)))
+
+
+def gen_tiny(root, rng, scale):
+    """Tens of thousands of files of at most a few hundred bytes"""
+    for i in range(int(30000 * scale)):
+        _write(os.path.join(root, f"dir_{i % 300:03d}", f"tiny_{i:06d}.txt"), _text(rng, rng.randrange(0, 300)))
+
+
+def gen_huge(root, rng, scale):
+    """A few files of tens of megabytes each"""
+    size = int(64 * 1024 * 1024 * scale)
+    for i in range(4):
+        block = _text(rng, 1024 * 1024)
+        with open(os.path.join(root, f"huge_{i}.log"), 'wb') as f:
+            written = 0
+            while written < size:
+                piece = block[:size - written]
+                f.write(piece)
+                written += len(piece)
+
+
+def gen_mixed(root, rng, scale):
+    """UTF-8, latin-1, CRLF and binary files, plus UTF-8 files that turn out to be latin-1 late"""
+    for i in range(int(2000 * scale)):
+        kind = i % 10
+        size = rng.randrange(500, 20000)
+        path = os.path.join(root, f"group_{i % 40:02d}")
+        if kind < 4:
+            data = _text(rng, size).replace(b"value", "värde ✓".encode('utf-8'))
+            _write(os.path.join(path, f"utf8_{i:05d}.txt"), data)
+        elif kind < 6:
+            data = _text(rng, size).replace(b"value", "värde".encode('latin-1'))
+            _write(os.path.join(path, f"latin1_{i:05d}.txt"), data)
+        elif kind < 8:
+            _write(os.path.join(path, f"crlf_{i:05d}.txt"), _text(rng, size, "\r\n"))
+        else:
+            _write(os.path.join(path, f"binary_{i:05d}.bin"), rng.randbytes(size))
+    # Falls back to latin-1 after the first chunks were already copied as UTF-8
+    for i in range(int(10 * scale)):
+        data = _text(rng, 3 * 1024 * 1024) + "café".encode('latin-1') + b"\n"
+        _write(os.path.join(root, "late_latin1", f"late_{i:02d}.txt"), data)
+
+
+GENERATORS = {
+    "wide": gen_wide,
+    "deep": gen_deep,
+    "tiny": gen_tiny,
+    "huge": gen_huge,
+    "mixed": gen_mixed,
+}
+
+
+def generate(name, root, scale):
+    """Generate one case and pin all mtimes, so listings are cacheable and runs repeatable"""
+    os.makedirs(root)
+    GENERATORS[name](root, random.Random(SEED), scale)
+    # Bottom-up, since touching a file would change its directory's mtime again
+    for directory, dirs, files in os.walk(root, topdown=False):
+        for file_name in files:
+            os.utime(os.path.join(directory, file_name), (TREE_MTIME, TREE_MTIME))
+        os.utime(directory, (TREE_MTIME, TREE_MTIME))
+
+
+def _peak_rss_kb():
+    try:
+        import resource
+    except ImportError:
+        return None  # Not available on Windows
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        rss //= 1024  # bytes on macOS, kilobytes elsewhere
+    return rss
+
+
+def run_case(root, output):
+    """Time the phases once in this process and return the measurements"""
+    sys.path.insert(0, REPO_ROOT)
+    import combine_engine
+    from path_filter import PathFilter
+
+    phases = {}
+
+    # populate_tree with recursive=True: list every directory, depth-first
+    start = time.perf_counter()
+    snapshot = combine_engine.DirectorySnapshot(PathFilter(root))
+    pending = [root]
+    entries = 0
+    while pending:
+        path = pending.pop()
+        dirs, files = snapshot.list_directory(path)
+        entries += len(dirs) + len(files)
+        pending.extend(os.path.join(path, item) for item in reversed(dirs))
+    phases['scan_tree'] = time.perf_counter() - start
+
+    # add_directory_files on the root
+    start = time.perf_counter()
+    files = list(combine_engine.iter_directory_files(root, path_filter=snapshot.path_filter))
+    phases['scan_files'] = time.perf_counter() - start
+
+    # The header of a combine, reusing the listings from the scan like the GUI
+    start = time.perf_counter()
+    combine_engine.write_header(io.StringIO(), root, files, snapshot=snapshot)
+    phases['header'] = time.perf_counter() - start
+
+    # _combine_files_task with a plain output
+    start = time.perf_counter()
+    estimate = combine_engine.plan_output(files)
+    combine_engine.combine_files(root, files, output, snapshot=snapshot, estimate=estimate, resumable=True)
+    phases['combine'] = time.perf_counter() - start
+
+    return {
+        'files': len(files),
+        'tree_entries': entries,
+        'input_bytes': estimate.input_bytes,
+        'output_bytes': os.path.getsize(output),
+        'phases': phases,
+        'peak_rss_kb': _peak_rss_kb(),
+    }
+
+
+def measure(root, output, repeat):
+    """Run a case in fresh child processes and keep the best time of each phase"""
+    best = None
+    for _ in range(repeat):
+        result = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", root, output],
+                                check=True, capture_output=True, text=True)
+        run = json.loads(result.stdout)
+        if best is None:
+            best = run
+            continue
+        for phase, seconds in run['phases'].items():
+            best['phases'][phase] = min(best['phases'][phase], seconds)
+        if run['peak_rss_kb'] is not None:
+            best['peak_rss_kb'] = min(best['peak_rss_kb'], run['peak_rss_kb'])
+
+    phases = best['phases']
+    best['throughput'] = {
+        'scan_tree_entries_per_s': best['tree_entries'] / max(phases['scan_tree'], 1e-9),
+        'scan_files_per_s': best['files'] / max(phases['scan_files'], 1e-9),
+        'combine_mb_per_s': best['input_bytes'] / (1024 * 1024) / max(phases['combine'], 1e-9),
+    }
+    return best
+
+
+def compare(results, baseline, tolerance, memory_tolerance):
+    """Print the changes against baseline and return the list of regressions"""
+    regressions = []
+    print(f"\n{'case':>8} {'metric':>12} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, case in results['cases'].items():
+        base = baseline['cases'].get(name)
+        if base is None:
+            print(f"{name:>8} {'(not in baseline)':>12}")
+            continue
+        metrics = [(phase, base['phases'].get(phase), case['phases'].get(phase), tolerance, NOISE_SECONDS)
+                   for phase in PHASES]
+        metrics.append(('peak_rss_kb', base.get('peak_rss_kb'), case.get('peak_rss_kb'), memory_tolerance, 0))
+        for metric, old, new, allowed, noise in metrics:
+            if old is None or new is None:
+                continue
+            change = (new - old) / old if old else 0.0
+            regressed = new > old * (1 + allowed) and new - old > noise
+            mark = "  REGRESSION" if regressed else ""
+            print(f"{name:>8} {metric:>12} {old:>12.4f} {new:>12.4f} {change:>+8.1%}{mark}")
+            if regressed:
+                regressions.append((name, metric, old, new))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--cases", nargs="+", choices=sorted(GENERATORS), default=list(GENERATORS),
+                        help="Cases to run (default: all)")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiplier for file counts and sizes")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per case, the best one counts")
+    parser.add_argument("--dir", help="Directory for the synthetic trees (default: a temp dir)")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare against the results in this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed slowdown per phase as a fraction (default: %(default)s)")
+    parser.add_argument("--memory-tolerance", type=float, default=0.10,
+                        help="Allowed growth of peak RSS as a fraction (default: %(default)s)")
+    parser.add_argument("--child", nargs=2, metavar=("ROOT", "OUTPUT"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_case(*args.child)))
+        return 0
+
+    results = {
+        'version': RESULTS_VERSION,
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'scale': args.scale,
+        'repeat': args.repeat,
+        'cases': {},
+    }
+
+    print(f"{'case':>8} {'files':>8} {'input':>10} " + " ".join(f"{phase + ' s':>12}" for phase in PHASES)
+          + f" {'MB/s':>8} {'RSS MB':>8}")
+    with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+        for name in args.cases:
+            root = os.path.join(tmp, name)
+            generate(name, root, args.scale)
+            case = measure(root, os.path.join(tmp, name + ".combined.txt"), args.repeat)
+            results['cases'][name] = case
+
+            mb = case['input_bytes'] / (1024 * 1024)
+            rss = f"{case['peak_rss_kb'] / 1024:.1f}" if case['peak_rss_kb'] is not None else "-"
+            print(f"{name:>8} {case['files']:>8} {mb:>7.1f} MB "
+                  + " ".join(f"{case['phases'][phase]:>12.4f}" for phase in PHASES)
+                  + f" {case['throughput']['combine_mb_per_s']:>8.1f} {rss:>8}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if baseline.get('scale') != args.scale:
+            print(f"Warning: baseline was run with --scale {baseline.get('scale')}", file=sys.stderr)
+        regressions = compare(results, baseline, args.tolerance, args.memory_tolerance)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) against {args.baseline}")
+            return 1
+        print(f"\nNo regressions against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
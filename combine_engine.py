@@ -0,0 +1,1392 @@
+"""
+Headless combine engine for File Combiner
+This module holds all of the combining logic and does not depend on tkinter,
+so it can be used from the GUI, the command line or other Python code.
+"""
+
+import io
+import os
+import json
+import codecs
+import hashlib
+import time
+import shutil
+import datetime
+import tempfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait as futures_wait
+
+from path_filter import DEFAULT_EXCLUDE_DIRS, PathFilter
+from output_writer import (AtomicOutput, CombineJournal, JOURNAL_SUFFIX, PARTIAL_SUFFIX, plan_shards,
+                           shard_path, shard_prefix)
+from combined_reader import DUPLICATE_NOTE, INDEX_SUFFIX, write_index
+
+# Size of the buffers used when copying file contents, so memory use stays
+# flat no matter how large the input files are
+CHUNK_SIZE = 1024 * 1024
+
+# Number of bytes read from the start of each file to classify it
+SNIFF_SIZE = 8192
+
+# File classifications returned by sniff_encoding
+ENCODING_UTF8 = 'utf-8'
+ENCODING_UTF8_BOM = 'utf-8-sig'
+ENCODING_UTF16 = 'utf-16'
+ENCODING_LATIN1 = 'latin-1'
+ENCODING_BINARY = 'binary'
+
+# Upper bound on file bytes held in memory by the prefetching reader pool
+DEFAULT_PREFETCH_BYTES = 64 * 1024 * 1024
+
+# Sidecar manifest used by incremental combines. Bump the version whenever
+# the way file contents are rendered changes, so old sections are not reused.
+MANIFEST_SUFFIX = '.manifest.json'
+MANIFEST_VERSION = 1
+
+# UTF-8 files up to this size are staged in memory, larger ones in a
+# temporary file, when the output cannot seek back (compressed streams)
+STAGE_IN_MEMORY_BYTES = 8 * 1024 * 1024
+
+# Rough number of output bytes per token of common LLM tokenizers, for
+# the approximate token counts in content statistics
+BYTES_PER_TOKEN = 4
+
+# Content statistics are filled into space reserved in the table of
+# contents, sized for twice the file's bytes (latin-1 grows when written as
+# UTF-8) plus this much for notes, markers and files growing meanwhile
+STATS_SLACK_BYTES = 4096
+
+# Widest text format_size returns, "1023 bytes"
+SIZE_TEXT_WIDTH = 10
+
+# Written instead of statistics that do not fit the space reserved for them
+NO_STATS = " (no statistics)"
+
+# Ends the header, after the table of contents
+_CONTENTS_SEPARATOR = "\n" + "=" * 80 + "\nFILE CONTENTS\n" + "=" * 80 + "\n\n"
+
+# Files smaller than this are always written out, since a back-reference
+# to an earlier copy would save next to nothing
+DEDUP_MIN_BYTES = 256
+
+
+def iter_directory_files(directory, exclude_dirs=None, path_filter=None, ignore=()):
+    """
+    Yield all files in a directory and its subdirectories that pass path_filter.
+    Files whose absolute path starts with one of the ignore prefixes are left
+    out, as in TreeWatcher.
+    """
+    if path_filter is None:
+        path_filter = PathFilter(directory, exclude_dirs=exclude_dirs)
+    ignore = tuple(ignore)
+
+    for root, dirs, files in os.walk(directory):
+        # Prune excluded directories before descending into them
+        dirs[:], files = path_filter.filter_listing(root, dirs, files)
+
+        if ignore:
+            absolute = os.path.abspath(root)
+            files = [file for file in files if not os.path.join(absolute, file).startswith(ignore)]
+        for file in files:
+            yield os.path.join(root, file)
+
+
+def scan_directory(directory):
+    """
+    List one directory level with os.scandir.
+    Returns (dirs, files) as name lists sorted by name; the cached entry
+    type is used so no extra stat calls are needed.
+    """
+    dirs = []
+    files = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                dirs.append(entry.name)
+            elif entry.is_file():
+                files.append(entry.name)
+    dirs.sort()
+    files.sort()
+    return dirs, files
+
+
+class DirectorySnapshot:
+    """
+    In-memory cache of directory listings shared by the tree panel and the
+    DIRECTORY STRUCTURE renderer. A cached listing is reused as long as the
+    directory's mtime is unchanged, so walking an unchanged tree again only
+    costs one stat per directory. Listings are cached unfiltered, so
+    path_filter can be replaced without invalidating them.
+    """
+
+    # Directories modified this recently are not cached, since a change within
+    # the same mtime tick would otherwise go unnoticed
+    MTIME_GRACE_SECONDS = 2
+
+    def __init__(self, path_filter=None):
+        self.path_filter = path_filter
+        self._listings = {}
+        # Counters for instrumentation
+        self.stat_calls = 0
+        self.listings = 0
+
+    def list_directory(self, directory):
+        """Return (dirs, files) name lists for a directory, sorted by name"""
+        self.stat_calls += 1
+        mtime = os.stat(directory).st_mtime_ns
+        cached = self._listings.get(directory)
+        if cached is not None and cached[0] == mtime:
+            dir_names, file_names = cached[1], cached[2]
+        else:
+            self.listings += 1
+            dir_names, file_names = scan_directory(directory)
+            if time.time() - mtime / 1e9 > self.MTIME_GRACE_SECONDS:
+                self._listings[directory] = (mtime, dir_names, file_names)
+
+        if self.path_filter is None:
+            return [d for d in dir_names if d not in DEFAULT_EXCLUDE_DIRS], file_names
+        return self.path_filter.filter_listing(directory, dir_names, file_names)
+
+    def invalidate(self, directory=None):
+        """Forget one cached directory, or everything"""
+        if directory is None:
+            self._listings.clear()
+        else:
+            self._listings.pop(directory, None)
+
+
+def collect_files(root_directory, include=None, exclude=None, exclude_dirs=None, use_gitignore=True,
+                  path_filter=None, ignore=()):
+    """Collect the files under root_directory in the same order as the GUI adds them"""
+    if path_filter is None:
+        path_filter = PathFilter(root_directory, include=include, exclude=exclude,
+                                 exclude_dirs=exclude_dirs, use_gitignore=use_gitignore)
+    return list(iter_directory_files(root_directory, path_filter=path_filter, ignore=ignore))
+
+
+def generate_tree_view(root_directory, directory=None, prefix="", is_last=True, exclude_dirs=None, snapshot=None):
+    """Generate a tree view of the directory structure."""
+    if directory is None:
+        directory = root_directory
+    if snapshot is None:
+        snapshot = DirectorySnapshot(PathFilter(root_directory, exclude_dirs=exclude_dirs))
+
+    lines = []
+
+    # Get relative directory name for the current level
+    rel_dir = os.path.relpath(directory, root_directory)
+    if rel_dir == '.':
+        dir_name = os.path.basename(root_directory)
+    else:
+        dir_name = os.path.basename(directory)
+
+    # Add this directory to the tree
+    if is_last:
+        lines.append(f"{prefix}└── {dir_name}/")
+        next_prefix = prefix + "    "
+    else:
+        lines.append(f"{prefix}├── {dir_name}/")
+        next_prefix = prefix + "│   "
+
+    # Get all items in the directory
+    try:
+        # Directories come first, then files
+        dirs, files = snapshot.list_directory(directory)
+
+        # Process directories
+        for i, item in enumerate(dirs):
+            item_path = os.path.join(directory, item)
+            is_last_dir = (i == len(dirs) - 1 and len(files) == 0)
+            lines.extend(generate_tree_view(root_directory, item_path, next_prefix, is_last_dir, snapshot=snapshot))
+
+        # Process files
+        for i, item in enumerate(files):
+            if i == len(files) - 1:  # Last item
+                lines.append(f"{next_prefix}└── {item}")
+            else:
+                lines.append(f"{next_prefix}├── {item}")
+    except PermissionError:
+        lines.append(f"{next_prefix}[Permission denied]")
+    except Exception as e:
+        lines.append(f"{next_prefix}[Error: {str(e)}]")
+
+    return lines
+
+
+def write_header(outfile, root_directory, files, created=None, snapshot=None, shard=None, tree_lines=None,
+                 stats=None):
+    """
+    Write the index, directory structure and table of contents.
+    shard is an output_writer.Shard when files are one part of a sharded
+    combine; its table of contents keeps the numbering of the full list.
+    tree_lines is the result of generate_tree_view if it was already run.
+    stats is (entries, total) as for table_of_contents.
+    """
+    if created is None:
+        created = datetime.datetime.now()
+    current_date = created.strftime("%Y-%m-%d %H:%M:%S")
+
+    outfile.write("=" * 80 + "\n")
+    outfile.write("COMBINED FILE INDEX\n")
+    outfile.write("=" * 80 + "\n")
+    outfile.write(f"Created: {current_date}\n")
+    outfile.write(f"Root Directory: {root_directory}\n")
+    outfile.write(f"Number of Files: {len(files)}\n")
+    if shard is not None:
+        outfile.write(f"Shard: {shard.describe()}\n")
+    outfile.write("\n")
+
+    # Add tree view of the directory structure
+    outfile.write("DIRECTORY STRUCTURE\n")
+    outfile.write("-" * 80 + "\n")
+
+    # Generate the tree view starting from the root directory
+    if tree_lines is None:
+        tree_lines = generate_tree_view(root_directory, snapshot=snapshot)
+    for line in tree_lines[1:]:  # Skip the first line (root dir with prefix)
+        outfile.write(line + "\n")
+    outfile.write("\n")
+
+    # Add table of contents with all selected files
+    outfile.write("TABLE OF CONTENTS\n")
+    outfile.write("-" * 80 + "\n")
+    outfile.write(table_of_contents(root_directory, files, shard.first if shard is not None else 0, stats))
+
+    # Add separator between header and content
+    outfile.write(_CONTENTS_SEPARATOR)
+
+
+def table_of_contents(root_directory, files, first=0, stats=None):
+    """
+    Return the table of contents entries, numbered from first + 1.
+    stats is (entries, total): a text appended to each entry, and one for
+    the total line written after the list, see stats_text.
+    """
+    lines = []
+    for i, file_path in enumerate(files, first):
+        rel_path = os.path.relpath(file_path, root_directory)
+        lines.append(f"{i+1}. {rel_path}{stats[0][i - first] if stats is not None else ''}\n")
+    if stats is not None:
+        lines.append(f"\nTotal:{stats[1]}\n")
+    return "".join(lines)
+
+
+def _encoded_length(text):
+    """Return the number of bytes text takes in an output, with platform newlines"""
+    return len(text.encode('utf-8')) + text.count("\n") * (len(os.linesep) - 1)
+
+
+def _stream_decoded(outfile, infile, encoding):
+    """Decode infile in chunks and write it to outfile with universal newlines"""
+    decoder = io.IncrementalNewlineDecoder(codecs.getincrementaldecoder(encoding)(), translate=True)
+    while True:
+        chunk = infile.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        outfile.write(decoder.decode(chunk))
+    outfile.write(decoder.decode(b"", final=True))
+
+
+def _utf8_boundary(data):
+    """Return the length of data without a trailing incomplete UTF-8 sequence"""
+    for i in range(1, min(3, len(data)) + 1):
+        byte = data[-i]
+        if byte & 0xC0 == 0x80:
+            # Continuation byte, keep looking for the lead byte
+            continue
+        if byte >= 0xF0:
+            needed = 4
+        elif byte >= 0xE0:
+            needed = 3
+        elif byte >= 0xC0:
+            needed = 2
+        else:
+            needed = 1
+        return len(data) - i if needed > i else len(data)
+    return len(data)
+
+
+def _copy_utf8(outfile, chunks):
+    """
+    Copy UTF-8 byte chunks to outfile. Chunks are only validated (ASCII
+    chunks with a quick isascii() check) and not re-encoded: when a chunk has
+    no carriage returns and the platform newline is "\n" its raw bytes go
+    straight to the binary buffer under outfile. Other chunks go through the
+    text layer, which translates newlines. Raises UnicodeDecodeError on
+    invalid UTF-8.
+    """
+    raw_ok = os.linesep == "\n" and hasattr(outfile, "buffer")
+    newlines = io.IncrementalNewlineDecoder(None, translate=True)
+    carry = b""
+    for data in chunks:
+        if carry:
+            data = carry + data
+        # Keep chunks on character boundaries so every chunk decodes on its own
+        cut = _utf8_boundary(data)
+        chunk, carry = data[:cut], data[cut:]
+        if raw_ok and b"\r" not in chunk and not newlines.getstate()[1] & 1:
+            if not chunk.isascii():
+                # Keep the result referenced until the next chunk: freeing
+                # it right away makes the allocator return the pages to the
+                # OS and fault them in again for every chunk
+                text = chunk.decode('utf-8')
+            outfile.flush()
+            outfile.buffer.write(chunk)
+        else:
+            outfile.write(newlines.decode(chunk.decode('utf-8')))
+    # Leftover bytes are a truncated character, which raises here
+    carry.decode('utf-8')
+    outfile.write(newlines.decode("", final=True))
+
+
+def _stream_utf8(outfile, infile):
+    """Copy a UTF-8 file in chunks, see _copy_utf8"""
+    _copy_utf8(outfile, iter(lambda: infile.read(CHUNK_SIZE), b""))
+
+
+def sniff_encoding(prefix):
+    """Classify a file from the first bytes of its contents"""
+    if prefix.startswith(codecs.BOM_UTF8):
+        return ENCODING_UTF8_BOM
+    if prefix.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return ENCODING_UTF16
+    # Text files practically never contain NUL bytes, binary formats nearly always do
+    if b"\0" in prefix:
+        return ENCODING_BINARY
+    try:
+        prefix[:_utf8_boundary(prefix)].decode('utf-8')
+        return ENCODING_UTF8
+    except UnicodeDecodeError:
+        return ENCODING_LATIN1
+
+
+def detect_encoding(file_path):
+    """Classify a file as utf-8, BOM-marked, latin-1 or binary"""
+    with open(file_path, 'rb') as infile:
+        return sniff_encoding(infile.read(SNIFF_SIZE))
+
+
+class HashingReader:
+    """Binary file wrapper that feeds every byte of the file to a hash exactly once"""
+
+    def __init__(self, infile, hasher):
+        self._infile = infile
+        self.hasher = hasher
+        self._hashed = 0
+
+    def read(self, size=-1):
+        position = self._infile.tell()
+        data = self._infile.read(size)
+        end = position + len(data)
+        # Reads after seeking back only hash the bytes not seen before
+        if end > self._hashed:
+            self.hasher.update(data[self._hashed - position:])
+            self._hashed = end
+        return data
+
+    def seek(self, offset, whence=0):
+        return self._infile.seek(offset, whence)
+
+    def tell(self):
+        return self._infile.tell()
+
+    def fileno(self):
+        return self._infile.fileno()
+
+
+class _RangeReader:
+    """Binary file wrapper that only returns the bytes in [start, end)"""
+
+    def __init__(self, infile, start, end):
+        self._infile = infile
+        self._end = end
+        infile.seek(start)
+
+    def read(self, size=-1):
+        remaining = self._end - self._infile.tell()
+        if remaining <= 0:
+            return b""
+        if size < 0 or size > remaining:
+            size = remaining
+        return self._infile.read(size)
+
+
+class _LineCounter:
+    """
+    Text output wrapper counting the lines written through it, including
+    bytes written to its binary buffer. Seeking back to a position returned
+    by tell() also takes the count back, like the rollback in
+    copy_file_contents.
+    """
+
+    def __init__(self, outfile):
+        self._outfile = outfile
+        self.buffer = _LineCountingBuffer(self, outfile.buffer)
+        self.newlines = 0
+        # Whether the last line written so far has no newline yet
+        self.open_line = False
+        self._marks = {}
+
+    @property
+    def lines(self):
+        return self.newlines + self.open_line
+
+    def count(self, data, newline):
+        if data:
+            self.newlines += data.count(newline)
+            self.open_line = not data.endswith(newline)
+
+    def write(self, text):
+        self.count(text, "\n")
+        return self._outfile.write(text)
+
+    def tell(self):
+        position = self._outfile.tell()
+        self._marks[position] = (self.newlines, self.open_line)
+        return position
+
+    def seek(self, position, whence=0):
+        if whence == 0 and position in self._marks:
+            self.newlines, self.open_line = self._marks[position]
+        return self._outfile.seek(position, whence)
+
+    def __getattr__(self, name):
+        return getattr(self._outfile, name)
+
+
+class _LineCountingBuffer:
+    """The binary buffer of a _LineCounter"""
+
+    def __init__(self, counter, buffer):
+        self._counter = counter
+        self._buffer = buffer
+
+    def write(self, data):
+        self._counter.count(data, b"\n")
+        return self._buffer.write(data)
+
+
+class OutputBudget:
+    """
+    Limits on how much of each file, and of all files together, is copied.
+    Byte limits count input bytes. Files over a limit keep their head and
+    tail with a truncation marker in between.
+    """
+
+    def __init__(self, max_file_bytes=None, max_file_lines=None, max_total_bytes=None):
+        for name, limit in (('max_file_bytes', max_file_bytes), ('max_file_lines', max_file_lines),
+                            ('max_total_bytes', max_total_bytes)):
+            if limit is not None and limit < 1:
+                raise ValueError(f"{name} must be at least 1, got {limit}")
+        self.max_file_bytes = max_file_bytes
+        self.max_file_lines = max_file_lines
+        self.max_total_bytes = max_total_bytes
+
+    def key(self):
+        """Settings that change how sections are rendered, for the incremental manifest"""
+        return [self.max_file_bytes, self.max_file_lines, self.max_total_bytes]
+
+
+class SizeEstimate:
+    """Result of the pre-flight stat pass done by plan_output"""
+
+    def __init__(self):
+        self.files = 0
+        self.input_bytes = 0
+        self.output_bytes = 0
+        self.truncated_files = 0
+        self.omitted_files = 0
+        # file path -> byte limit for files that do not fit the budget
+        self.limits = {}
+        # file path -> (size, mtime_ns) from the stat pass
+        self.stats = {}
+
+    def describe(self):
+        text = f"{self.files} files, {format_size(self.input_bytes)} input, ~{format_size(self.output_bytes)} output"
+        if self.truncated_files:
+            text += f", {self.truncated_files} truncated"
+        if self.omitted_files:
+            text += f", {self.omitted_files} omitted"
+        return text
+
+
+def format_size(size):
+    """Return size in bytes as a short human readable string"""
+    for unit in ('bytes', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f"{size} {unit}" if unit == 'bytes' else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+class ContentStats:
+    """Lines, bytes and approximate tokens of the contents written for one file, or for several"""
+
+    def __init__(self, lines=0, size=0):
+        self.lines = lines
+        self.size = size
+
+    @property
+    def tokens(self):
+        return -(-self.size // BYTES_PER_TOKEN)
+
+    def add(self, other):
+        self.lines += other.lines
+        self.size += other.size
+
+    def describe(self):
+        return f"{self.lines} lines, {format_size(self.size)}, ~{self.tokens} tokens"
+
+
+def stats_width(max_bytes):
+    """Room needed by stats_text for contents of at most max_bytes"""
+    return len(f" ({max_bytes} lines, , ~{-(-max_bytes // BYTES_PER_TOKEN)} tokens)") + SIZE_TEXT_WIDTH
+
+
+def stats_text(stats, width):
+    """
+    Return " (12 lines, 1.2 KB, ~300 tokens)" padded to width, or blanks for
+    the space reserved before the statistics are known (stats is None)
+    """
+    if stats is None:
+        return " " * width
+    text = f" ({stats.describe()})"
+    return (text if len(text) <= width else NO_STATS).ljust(width)
+
+
+def plan_output(files, budget=None, metrics=None):
+    """
+    Stat every file once and work out how many bytes of each will be copied.
+    The total budget is handed out in table of contents order, so files
+    after it runs out are omitted without being read. Line limits are only
+    known while copying, so they are not part of the estimate.
+    metrics is an instrumentation.Metrics that times this as phase "plan".
+    """
+    if metrics is not None:
+        with metrics.phase('plan'):
+            estimate = plan_output(files, budget)
+        metrics.count('stat_calls', len(files))
+        metrics.count('files', estimate.files)
+        metrics.count('input_bytes', estimate.input_bytes)
+        return estimate
+
+    estimate = SizeEstimate()
+    max_file = budget.max_file_bytes if budget is not None else None
+    remaining = budget.max_total_bytes if budget is not None else None
+
+    for file_path in files:
+        try:
+            stat = os.stat(file_path)
+            size = stat.st_size
+            estimate.stats[file_path] = (size, stat.st_mtime_ns)
+        except OSError:
+            size = 0
+        estimate.files += 1
+        estimate.input_bytes += size
+
+        allowed = size
+        if max_file is not None:
+            allowed = min(allowed, max_file)
+        if remaining is not None:
+            allowed = min(allowed, remaining)
+            remaining -= allowed
+        if allowed < size:
+            estimate.limits[file_path] = allowed
+            if allowed == 0:
+                estimate.omitted_files += 1
+            else:
+                estimate.truncated_files += 1
+        estimate.output_bytes += allowed
+
+    return estimate
+
+
+def dedup_candidates(files, estimate, min_bytes=DEDUP_MIN_BYTES):
+    """
+    Size pre-filter for deduplication: return the set of files that share
+    their size with another file in files, using the sizes from the
+    estimate's stat pass. Only these can have the same contents as another
+    file, so only these are hashed. Files cut by the budget are left out.
+    """
+    by_size = {}
+    for file_path in files:
+        stat = estimate.stats.get(file_path)
+        if stat is None or stat[0] < min_bytes or file_path in estimate.limits:
+            continue
+        by_size.setdefault(stat[0], []).append(file_path)
+    return {file_path for group in by_size.values() if len(group) > 1 for file_path in group}
+
+
+def _lines_end(infile, start, end, lines):
+    """Return the offset just after the given number of lines from start, at most end"""
+    infile.seek(start)
+    position = start
+    while position < end and lines > 0:
+        chunk = infile.read(min(CHUNK_SIZE, end - position))
+        if not chunk:
+            break
+        count = chunk.count(b"\n")
+        if count < lines:
+            lines -= count
+            position += len(chunk)
+            continue
+        index = -1
+        for _ in range(lines):
+            index = chunk.index(b"\n", index + 1)
+        return position + index + 1
+    return end
+
+
+def _lines_start(infile, start, end, lines):
+    """Return the offset where the last given number of lines before end begin, at least start"""
+    if lines <= 0:
+        return end
+    position = end
+    # A newline right at the end closes the last line rather than starting a new one
+    infile.seek(max(start, end - 1))
+    if end > start and infile.read(1) == b"\n":
+        lines += 1
+    while position > start:
+        size = min(CHUNK_SIZE, position - start)
+        infile.seek(position - size)
+        chunk = infile.read(size)
+        count = chunk.count(b"\n")
+        if count < lines:
+            lines -= count
+            position -= size
+            continue
+        index = len(chunk)
+        for _ in range(lines):
+            index = chunk.rindex(b"\n", 0, index)
+        return position - size + index + 1
+    return start
+
+
+def _truncation(infile, encoding, start, size, max_bytes, max_lines):
+    """
+    Work out which part of a file is dropped to fit the limits.
+    Returns (head_end, tail_start), or None if the whole file fits.
+    """
+    # Without limits the head covers everything and so does the tail
+    head_end, tail_start = size, start
+    if max_bytes is not None and size - start > max_bytes:
+        head_end = start + max_bytes - max_bytes // 2
+        tail_start = size - max_bytes // 2
+    if max_lines is not None:
+        head_end = min(head_end, _lines_end(infile, start, head_end, max_lines - max_lines // 2))
+        tail_start = max(tail_start, _lines_start(infile, head_end, size, max_lines // 2))
+    if head_end >= tail_start:
+        return None
+
+    if encoding == ENCODING_UTF16:
+        # Only the head is kept, decoding can not resume mid-file without the BOM
+        return head_end - (head_end - start) % 2, size
+    if encoding in (ENCODING_UTF8, ENCODING_UTF8_BOM):
+        # Move both cuts onto character boundaries
+        window_start = max(start, head_end - 3)
+        infile.seek(window_start)
+        window = infile.read(head_end - window_start)
+        head_end = window_start + _utf8_boundary(window)
+        infile.seek(tail_start)
+        for byte in infile.read(3):
+            if byte & 0xC0 != 0x80:
+                break
+            tail_start += 1
+    return head_end, tail_start
+
+
+def _stream_parts(outfile, infile, encoding, start, size, truncation):
+    """Stream a whole file, or its head and tail around a truncation marker"""
+    if encoding in (ENCODING_UTF8, ENCODING_UTF8_BOM):
+        def stream(reader):
+            _stream_utf8(outfile, reader)
+    else:
+        def stream(reader):
+            _stream_decoded(outfile, reader, encoding)
+
+    if truncation is None:
+        infile.seek(start)
+        stream(infile)
+        return
+
+    head_end, tail_start = truncation
+    stream(_RangeReader(infile, start, head_end))
+    outfile.write(f"\n[... {tail_start - head_end} bytes truncated ...]\n")
+    if tail_start < size:
+        stream(_RangeReader(infile, tail_start, size))
+
+
+def copy_file_contents(outfile, file_path, hasher=None, max_bytes=None, max_lines=None):
+    """
+    Stream the contents of file_path into outfile using bounded buffers.
+    The file is classified once from its first bytes and then streamed with
+    the matching codec. Binary files are summarized instead of copied.
+    Files over max_bytes or max_lines keep their head and tail around a
+    truncation marker, without reading the part in between.
+    If hasher is given it is updated with the file's bytes (binary and
+    truncated files are not read completely, so their hash is incomplete).
+    Returns the detected encoding.
+    """
+    with open(file_path, 'rb') as raw_file:
+        infile = raw_file if hasher is None else HashingReader(raw_file, hasher)
+        encoding = sniff_encoding(infile.read(SNIFF_SIZE))
+        size = os.fstat(raw_file.fileno()).st_size
+
+        if encoding == ENCODING_BINARY:
+            outfile.write(f"[Binary file not included: {size} bytes]")
+            return encoding
+
+        if max_bytes == 0:
+            outfile.write(f"[File not included, output size budget reached: {size} bytes]")
+            return encoding
+
+        start = len(codecs.BOM_UTF8) if encoding == ENCODING_UTF8_BOM else 0
+        truncation = None
+        if max_bytes is not None or max_lines is not None:
+            truncation = _truncation(raw_file, encoding, start, size, max_bytes, max_lines)
+
+        if encoding != ENCODING_UTF8:
+            _stream_parts(outfile, infile, encoding, start, size, truncation)
+            return encoding
+
+        if not outfile.seekable():
+            return _copy_staged(outfile, infile, start, size, truncation)
+
+        # The prefix was valid UTF-8, but an invalid byte may still turn up later
+        rollback = outfile.tell()
+        try:
+            _stream_parts(outfile, infile, encoding, start, size, truncation)
+            return encoding
+        except UnicodeDecodeError:
+            pass
+        # Drop what was written so far and decode the whole file again as latin-1
+        outfile.seek(rollback)
+        outfile.truncate()
+        _stream_parts(outfile, infile, ENCODING_LATIN1, start, size, truncation)
+        return ENCODING_LATIN1
+
+
+def _copy_staged(outfile, infile, start, size, truncation):
+    """
+    Copy a UTF-8 file through a staging buffer, for outputs that cannot seek
+    back if the file turns out not to be UTF-8 after all.
+    """
+    staging = io.BytesIO() if size <= STAGE_IN_MEMORY_BYTES else tempfile.TemporaryFile()
+    with staging:
+        staged = io.TextIOWrapper(staging, encoding='utf-8')
+        try:
+            _stream_parts(staged, infile, ENCODING_UTF8, start, size, truncation)
+            encoding = ENCODING_UTF8
+        except UnicodeDecodeError:
+            staged.seek(0)
+            staged.truncate()
+            _stream_parts(staged, infile, ENCODING_LATIN1, start, size, truncation)
+            encoding = ENCODING_LATIN1
+        staged.flush()
+        staging.seek(0)
+        outfile.flush()
+        shutil.copyfileobj(staging, outfile.buffer, CHUNK_SIZE)
+        staged.detach()
+    return encoding
+
+
+def render_file_contents(file_path, hash_contents=False, max_bytes=None, max_lines=None):
+    """
+    Return the encoded output bytes for a file, exactly as copy_file_contents
+    writes them, together with the content hash if hash_contents is set.
+    """
+    buffer = io.BytesIO()
+    text = io.TextIOWrapper(buffer, encoding='utf-8')
+    hasher = hashlib.sha256() if hash_contents and max_bytes is None and max_lines is None else None
+    encoding = copy_file_contents(text, file_path, hasher, max_bytes, max_lines)
+    text.flush()
+    return buffer.getvalue(), _digest(hasher, encoding)
+
+
+def hash_file(file_path):
+    """Return the SHA-256 of a file's bytes, read in bounded chunks"""
+    hasher = hashlib.sha256()
+    with open(file_path, 'rb') as infile:
+        for chunk in iter(lambda: infile.read(CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def _digest(hasher, encoding):
+    if hasher is None or encoding == ENCODING_BINARY:
+        return None
+    return hasher.hexdigest()
+
+
+def prefetch_files(files, workers, budget=DEFAULT_PREFETCH_BYTES, skip=(), hash_contents=False,
+                   limits=None, max_lines=None, metrics=None):
+    """
+    Read and decode files ahead of the writer on a thread pool.
+    Yields (file_path, future) in the original order. The future resolves to
+    the result of render_file_contents, or is None for files in skip and
+    files larger than the byte budget, which the writer should handle itself.
+    Roughly budget bytes of file contents are held in memory at any time.
+    limits maps file paths to byte limits, as in SizeEstimate.limits.
+    With metrics the workers' reading and decoding is timed as phase "render".
+    """
+    if limits is None:
+        limits = {}
+    render = render_file_contents if metrics is None else metrics.timed('render', render_file_contents)
+    max_pending = workers * 4
+    pending = deque()
+    in_flight = 0
+    remaining = iter(files)
+    next_file = next(remaining, None)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        while True:
+            # Queue up more files while the budget allows
+            while next_file is not None and len(pending) < max_pending:
+                if next_file in skip:
+                    pending.append((next_file, None, 0))
+                    next_file = next(remaining, None)
+                    continue
+                try:
+                    size = os.path.getsize(next_file)
+                except OSError:
+                    size = 0  # The worker reports the error
+                max_bytes = limits.get(next_file)
+                if max_bytes is not None:
+                    size = min(size, max_bytes)
+                if size > budget:
+                    pending.append((next_file, None, 0))
+                elif in_flight + size <= budget or in_flight == 0:
+                    future = pool.submit(render, next_file, hash_contents, max_bytes, max_lines)
+                    pending.append((next_file, future, size))
+                    in_flight += size
+                else:
+                    break
+                next_file = next(remaining, None)
+
+            if not pending:
+                break
+
+            file_path, future, size = pending.popleft()
+            yield file_path, future
+            # The writer is done with this file once control comes back here
+            in_flight -= size
+
+
+def manifest_path(output_file):
+    """Return the path of the incremental manifest kept next to output_file"""
+    return output_file + MANIFEST_SUFFIX
+
+
+def output_paths(output_file):
+    """
+    Return absolute path prefixes covering output_file, its shards and the
+    temporary and sidecar files written next to them, for the ignore option
+    of collect_files and TreeWatcher
+    """
+    output_file = os.path.abspath(output_file)
+    paths = [output_file + suffix for suffix in ('', PARTIAL_SUFFIX, JOURNAL_SUFFIX, MANIFEST_SUFFIX, INDEX_SUFFIX)]
+    paths.append(shard_prefix(output_file))
+    return paths
+
+
+def load_manifest(output_file, budget_key=None):
+    """
+    Return the sections recorded by the previous incremental run, keyed by
+    relative path. Returns {} when there is no manifest, the output it
+    describes has changed since, or it was written with a different budget.
+    """
+    try:
+        with open(manifest_path(output_file), 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        stat = os.stat(output_file)
+    except (OSError, ValueError):
+        return {}
+
+    if (manifest.get('version') != MANIFEST_VERSION
+            or manifest.get('linesep') != os.linesep
+            or manifest.get('budget') != budget_key
+            or manifest.get('output_size') != stat.st_size
+            or manifest.get('output_mtime_ns') != stat.st_mtime_ns):
+        return {}
+    return {section['path']: section for section in manifest['sections']}
+
+
+def write_manifest(output_file, sections, budget_key=None):
+    """Record the sections written to output_file for the next incremental run"""
+    stat = os.stat(output_file)
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'linesep': os.linesep,
+        'budget': budget_key,
+        'output_size': stat.st_size,
+        'output_mtime_ns': stat.st_mtime_ns,
+        'sections': sections,
+    }
+    temp_path = manifest_path(output_file) + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(temp_path, manifest_path(output_file))
+
+
+def _copy_range(source, outfile, offset, length):
+    """Copy length bytes at offset in the binary file source to outfile"""
+    outfile.flush()
+    source.seek(offset)
+    while length > 0:
+        chunk = source.read(min(CHUNK_SIZE, length))
+        if not chunk:
+            raise EOFError("Previous output is shorter than its manifest")
+        outfile.buffer.write(chunk)
+        length -= len(chunk)
+
+
+def write_file_section(outfile, root_directory, file_path, *, prefetched=None, record=None, reuse=None,
+                       max_bytes=None, max_lines=None, hash_contents=False, duplicate=None, count_lines=False):
+    """
+    Write a single file with its path header.
+    prefetched is a future from prefetch_files holding the rendered contents.
+    If record is a dict it is filled with the byte offset and length of the
+    contents (for outputs that can seek), and their hash if hash_contents
+    is set. reuse is (previous_output, section) to copy the contents
+    from an earlier combine instead of reading the file. max_bytes and
+    max_lines truncate the contents, see copy_file_contents. duplicate is
+    (number, rel_path) of an earlier section with the same contents, which
+    is referred to instead of writing them again. With count_lines the
+    number of lines of the contents is added to record.
+    """
+    # Get relative path
+    rel_path = os.path.relpath(file_path, root_directory)
+
+    # Write file header with the specified format
+    outfile.write(f"((({rel_path})))\n\n")
+
+    # Compressed outputs have no byte offsets
+    seekable = record is not None and outfile.seekable()
+    if seekable:
+        outfile.flush()
+        record['offset'] = outfile.tell()
+    hasher = None
+    if record is not None and hash_contents and max_bytes is None and max_lines is None:
+        hasher = hashlib.sha256()
+    counter = None
+    if record is not None and count_lines:
+        # Count the lines on their way out, so the contents are not read twice
+        outfile = counter = _LineCounter(outfile)
+
+    # Write file contents
+    try:
+        if duplicate is not None:
+            number, first_path = duplicate
+            outfile.write(DUPLICATE_NOTE.format(number=number, path=first_path))
+            digest = None
+            if record is not None:
+                record['duplicate_of'] = first_path
+        elif reuse is not None:
+            previous_output, section = reuse
+            _copy_range(previous_output, outfile, section['offset'], section['length'])
+            digest = section['sha256']
+        elif prefetched is None:
+            encoding = copy_file_contents(outfile, file_path, hasher, max_bytes, max_lines)
+            digest = _digest(hasher, encoding)
+        else:
+            data, digest = prefetched.result()
+            outfile.flush()
+            outfile.buffer.write(data)
+    except Exception as e:
+        outfile.write(f"[Error reading file: {str(e)}]")
+        if record is not None:
+            record['error'] = True
+
+    if seekable:
+        outfile.flush()
+        record['length'] = outfile.tell() - record['offset']
+    if record is not None and not record.get('error'):
+        record['sha256'] = digest
+    if counter is not None:
+        record['lines'] = counter.lines
+        outfile = counter._outfile
+
+    # Add separator between files
+    outfile.write("\n\n")
+
+
+def combine_files(root_directory, files, output_file, progress=None, created=None,
+                  workers=0, prefetch_bytes=DEFAULT_PREFETCH_BYTES, snapshot=None,
+                  incremental=False, budget=None, estimate=None, compression=None, shard_bytes=None,
+                  index=False, resumable=False, metrics=None, dedup=False, stats=False):
+    """
+    Combine files into output_file and return the number of files written.
+    The output is written next to output_file and renamed into place once
+    it is complete, so a failed combine never leaves a truncated output.
+    progress is called as progress(index, total) before each file.
+    With workers > 0 a thread pool prefetches and decodes upcoming files,
+    holding at most about prefetch_bytes of file contents in memory.
+    snapshot is a DirectorySnapshot reused for the directory structure.
+    With incremental=True a manifest is kept next to the output, and files
+    whose size and mtime are unchanged since the last run are copied from
+    the previous output instead of being read again.
+    budget is an OutputBudget limiting how much of each file is copied.
+    estimate is the result of plan_output(files, budget) if the caller
+    already ran the stat pass, e.g. to show it before combining.
+    compression is 'gzip' or 'xz' to compress the output while it is written.
+    With shard_bytes the output is split into files holding roughly that
+    many bytes of file contents each, named by output_writer.shard_path,
+    and each with its own index header and table of contents.
+    With index=True a byte-offset index of the sections is written next to
+    each output file, see combined_reader.
+    With resumable=True finished sections are checkpointed to a journal, and
+    a combine of the same files that was interrupted continues after the
+    last checkpoint instead of starting over.
+    metrics is an instrumentation.Metrics that collects phase timings,
+    counters and the slowest files.
+    With dedup=True a file whose contents already appear earlier in the same
+    output is written as a note pointing to that section instead.
+    With stats=True the lines, bytes and approximate tokens of each file's
+    contents are counted while they are written and listed in the table of
+    contents, together with the total. Use Combiner to get them as
+    ContentStats as well.
+    """
+    combiner = Combiner(root_directory, files, output_file, progress=progress, created=created, workers=workers,
+                        prefetch_bytes=prefetch_bytes, snapshot=snapshot, incremental=incremental,
+                        budget=budget, estimate=estimate, compression=compression, shard_bytes=shard_bytes,
+                        index=index, resumable=resumable, metrics=metrics, dedup=dedup, stats=stats)
+    return combiner.run()
+
+
+class Combiner:
+    """Writes one combined file, see combine_files for the options"""
+
+    def __init__(self, root_directory, files, output_file, progress=None, created=None,
+                 workers=0, prefetch_bytes=DEFAULT_PREFETCH_BYTES, snapshot=None,
+                 incremental=False, budget=None, estimate=None, compression=None, shard_bytes=None,
+                 index=False, resumable=False, metrics=None, dedup=False, stats=False):
+        if incremental and (compression is not None or shard_bytes is not None):
+            raise ValueError("Incremental combines need a single uncompressed output")
+        if index and compression is not None:
+            raise ValueError("Compressed outputs cannot be indexed, since they cannot be read at an offset")
+        if resumable and (compression is not None or incremental):
+            raise ValueError("Only plain, non-incremental combines can be resumed")
+        if dedup and incremental:
+            raise ValueError("Incremental combines cannot deduplicate, since reused sections may refer to moved ones")
+        if stats and compression is not None:
+            raise ValueError("Content statistics need an uncompressed output, since they are filled in at the end")
+        self.root_directory = root_directory
+        self.files = files
+        self.output_file = output_file
+        self.progress = progress
+        self.created = created
+        self.workers = workers
+        self.prefetch_bytes = prefetch_bytes
+        self.snapshot = snapshot
+        self.incremental = incremental
+        self.budget = budget
+        self.estimate = estimate
+        self.compression = compression
+        self.shard_bytes = shard_bytes
+        self.index = index
+        self.resumable = resumable
+        self.metrics = metrics
+        self.dedup = dedup
+        self.stats = stats
+        # DIRECTORY STRUCTURE lines, rendered once for all shards
+        self._tree_lines = None
+        # Paths of the files written by run()
+        self.outputs = []
+        # Number of sections taken over from an interrupted run
+        self.resumed = 0
+        # Number of sections written as a reference to an earlier copy
+        self.duplicates = 0
+        # Number of sections copied from the previous output by incremental combines
+        self.reused = 0
+        # With stats: relative path -> ContentStats of the written contents, and their sum
+        self.file_stats = {}
+        self.total_stats = ContentStats()
+
+    def run(self):
+        """Write the output and return the number of files"""
+        total_files = self._run()
+        if self.metrics is not None:
+            self.metrics.count('output_bytes', sum(os.path.getsize(path) for path in self.outputs))
+        return total_files
+
+    def _run(self):
+        if self.estimate is None:
+            self.estimate = plan_output(self.files, self.budget, self.metrics)
+
+        if self.shard_bytes is not None:
+            shards = plan_shards(self.files, self.estimate, self.shard_bytes)
+            if self.created is None:
+                self.created = datetime.datetime.now()
+            for shard in shards:
+                path = shard_path(self.output_file, shard.index)
+                records = self._write(path, shard.files, shard=shard)
+                self._write_index(path, shard.files, records)
+            return len(self.files)
+
+        if not self.incremental:
+            records = self._write(self.output_file, self.files)
+            self._write_index(self.output_file, self.files, records)
+            return len(self.files)
+
+        budget_key = self.budget.key() if self.budget is not None else None
+        previous = load_manifest(self.output_file, budget_key)
+
+        # The stat pass from the estimate decides which sections can be reused
+        reusable = {}
+        for file_path in self.files:
+            stat = self.estimate.stats.get(file_path)
+            section = previous.get(os.path.relpath(file_path, self.root_directory))
+            if (stat is not None and section is not None
+                    and (section['size'], section['mtime_ns']) == stat
+                    and section.get('limit') == self.estimate.limits.get(file_path)):
+                reusable[file_path] = section
+
+        records = self._write(self.output_file, self.files, reusable)
+
+        sections = []
+        for file_path, record in zip(self.files, records):
+            stat = self.estimate.stats.get(file_path)
+            if record.get('error') or stat is None:
+                continue
+            sections.append({
+                'path': os.path.relpath(file_path, self.root_directory),
+                'size': stat[0],
+                'mtime_ns': stat[1],
+                'limit': self.estimate.limits.get(file_path),
+                'sha256': record['sha256'],
+                'offset': record['offset'],
+                'length': record['length'],
+            })
+        write_manifest(self.output_file, sections, budget_key)
+        self._write_index(self.output_file, self.files, records)
+        return len(self.files)
+
+    def _write_index(self, output_file, files, records):
+        if not self.index:
+            return
+        sections = []
+        by_path = {}
+        for file_path, record in zip(files, records):
+            rel_path = os.path.relpath(file_path, self.root_directory)
+            section = {'path': rel_path, 'offset': record['offset'], 'length': record['length']}
+            first_path = record.get('duplicate_of')
+            if first_path is not None:
+                # Point at the bytes of the first copy, so reading it needs no lookup
+                first_section = by_path[first_path]
+                section.update(offset=first_section['offset'], length=first_section['length'],
+                               duplicate_of=first_path)
+            by_path[rel_path] = section
+            sections.append(section)
+        write_index(output_file, sections)
+
+    def _stats_texts(self, widths, stats=None):
+        """Statistics texts for table_of_contents, blank where stats is None"""
+        if widths is None:
+            return None
+        if stats is None:
+            stats = [None] * len(widths)
+        texts = [stats_text(file_stats, width) for file_stats, width in zip(stats, widths)]
+        return texts[:-1], texts[-1]
+
+    def _fill_stats(self, outfile, files, records, widths, header_end, shard):
+        """Collect the statistics of the written sections and write them into the reserved space"""
+        stats = []
+        total = ContentStats()
+        for file_path, record in zip(files, records):
+            file_stats = ContentStats(record['lines'], record['length'])
+            self.file_stats[os.path.relpath(file_path, self.root_directory)] = file_stats
+            total.add(file_stats)
+            stats.append(file_stats)
+        self.total_stats.add(total)
+        stats.append(total)
+
+        first = shard.first if shard is not None else 0
+        toc = table_of_contents(self.root_directory, files, first, self._stats_texts(widths, stats))
+        outfile.flush()
+        end = outfile.tell()
+        outfile.seek(header_end - _encoded_length(toc + _CONTENTS_SEPARATOR))
+        outfile.write(toc)
+        outfile.flush()
+        outfile.seek(end)
+
+    def _job(self, files, shard):
+        """Everything that decides the bytes of one output, for matching a journal to a rerun"""
+        listing = hashlib.sha256()
+        for file_path in files:
+            stat = self.estimate.stats.get(file_path)
+            listing.update(f"{file_path}\0{stat}\0{self.estimate.limits.get(file_path)}\n".encode('utf-8'))
+        return {
+            'root': os.path.abspath(self.root_directory),
+            'files': listing.hexdigest(),
+            'budget': self.budget.key() if self.budget is not None else None,
+            'shard': shard.describe() if shard is not None else None,
+            'index': self.index,
+            'dedup': self.dedup,
+            'stats': self.stats,
+            'linesep': os.linesep,
+        }
+
+    def _tree(self):
+        """Render the DIRECTORY STRUCTURE lines once"""
+        if self._tree_lines is None:
+            snapshot = self.snapshot or DirectorySnapshot(PathFilter(self.root_directory))
+            stat_calls, listings = snapshot.stat_calls, snapshot.listings
+            start = time.perf_counter()
+            self._tree_lines = generate_tree_view(self.root_directory, snapshot=snapshot)
+            if self.metrics is not None:
+                self.metrics.add_time('tree', time.perf_counter() - start)
+                self.metrics.count('stat_calls', snapshot.stat_calls - stat_calls)
+                self.metrics.count('directories_listed', snapshot.listings - listings)
+        return self._tree_lines
+
+    def _write(self, output_file, files, reusable=None, shard=None):
+        """
+        Write one combined file and return the section records when reusing
+        sections, indexing, deduplicating or counting. reusable maps file paths to
+        sections of the previous output_file that are copied instead of
+        reading the file.
+        """
+        total_files = len(self.files)
+        first = shard.first if shard is not None else 0
+        hash_contents = reusable is not None
+        limits = self.estimate.limits
+        max_lines = self.budget.max_file_lines if self.budget is not None else None
+        # Line limits may cut a file, and hashes of cut files are incomplete
+        candidates = dedup_candidates(files, self.estimate) if self.dedup and max_lines is None else set()
+        track = hash_contents or self.index or bool(candidates) or self.stats
+        metrics = self.metrics
+        records = []
+
+        output = AtomicOutput(output_file, self.compression)
+        journal = CombineJournal(output_file, self._job(files, shard) if self.resumable else None)
+        resume = journal.load() if self.resumable else None
+        if resume is not None and os.path.exists(output.temp_path):
+            created, done, end, records = resume
+            self.created = datetime.datetime.fromisoformat(created)
+            self.resumed += done
+        else:
+            resume = None
+            done = 0
+            if self.created is None:
+                self.created = datetime.datetime.now()
+
+        # Hash -> (number, rel_path) of the first section with those contents,
+        # and the sizes of those sections. A candidate whose size is not among
+        # them cannot be a duplicate, so it is only hashed while it is copied.
+        first_copies = {}
+        copied_sizes = set()
+
+        # The previous output is read while the new one is written, which is
+        # fine since the new one only replaces it at the end
+        previous_output = None
+        try:
+            outfile = output.open(resume_at=resume[2] if resume else None)
+            if self.resumable:
+                journal.start(self.created.isoformat(), done, resume[2] if resume else None, records)
+            else:
+                # A journal left by an interrupted resumable run no longer matches
+                journal.remove()
+            previous_output = open(output_file, 'rb') if reusable else None
+            for number, (file_path, record) in enumerate(zip(files, records), first + 1):
+                if record is None:
+                    continue  # Sections of combines that keep no records
+                if record.get('duplicate_of'):
+                    self.duplicates += 1
+                elif file_path in candidates and record.get('sha256'):
+                    first_copies.setdefault(record['sha256'],
+                                            (number, os.path.relpath(file_path, self.root_directory)))
+                    copied_sizes.add(self.estimate.stats[file_path][0])
+
+            self.outputs.append(output_file)
+            widths = None
+            if self.stats:
+                # Space for the statistics is reserved now and filled in once they are known
+                sizes = [self.estimate.stats.get(file_path, (0,))[0] * 2 + STATS_SLACK_BYTES for file_path in files]
+                widths = [stats_width(size) for size in sizes] + [stats_width(sum(sizes))]
+            if resume is None:
+                tree_lines = self._tree()
+                start = time.perf_counter()
+                write_header(outfile, self.root_directory, files, self.created, shard=shard,
+                             tree_lines=tree_lines, stats=self._stats_texts(widths))
+                if metrics is not None:
+                    metrics.add_time('header', time.perf_counter() - start)
+                if self.stats:
+                    outfile.flush()
+                    header_end = outfile.tell()
+            elif self.stats:
+                # The header ends where the first section's path header starts
+                header_end = records[0]['offset'] - _encoded_length(
+                    f"((({os.path.relpath(files[0], self.root_directory)})))\n\n")
+
+            remaining = files[done:]
+            if self.workers > 0:
+                # Candidates are written by this thread, once it knows whether they are duplicates
+                sections = prefetch_files(remaining, self.workers, self.prefetch_bytes,
+                                          skip=candidates.union(reusable or ()),
+                                          hash_contents=hash_contents, limits=limits, max_lines=max_lines,
+                                          metrics=metrics)
+            else:
+                sections = ((file_path, None) for file_path in remaining)
+
+            # Process each file
+            for i, (file_path, prefetched) in enumerate(sections, first + done):
+                if self.progress is not None:
+                    self.progress(i, total_files)
+                record = {} if track else None
+                reuse = None
+                if reusable and file_path in reusable:
+                    reuse = (previous_output, reusable[file_path])
+                    self.reused += 1
+                if metrics is not None:
+                    start = ready = time.perf_counter()
+                    if prefetched is not None:
+                        # Time spent waiting for the reader threads to catch up
+                        futures_wait([prefetched])
+                        ready = time.perf_counter()
+                        metrics.add_time('prefetch_wait', ready - start)
+                candidate = file_path in candidates
+                duplicate = None
+                if candidate and self.estimate.stats[file_path][0] in copied_sizes:
+                    try:
+                        duplicate = first_copies.get(hash_file(file_path))
+                    except OSError:
+                        pass  # Reported when the file is copied
+                write_file_section(outfile, self.root_directory, file_path, prefetched=prefetched, record=record,
+                                   reuse=reuse, max_bytes=limits.get(file_path), max_lines=max_lines,
+                                   hash_contents=hash_contents or candidate, duplicate=duplicate,
+                                   count_lines=self.stats)
+                records.append(record)
+                if duplicate is not None:
+                    self.duplicates += 1
+                elif candidate and record.get('sha256'):
+                    first_copies.setdefault(record['sha256'], (i + 1, os.path.relpath(file_path, self.root_directory)))
+                    copied_sizes.add(self.estimate.stats[file_path][0])
+                if metrics is not None:
+                    # Sequential copies read, decode and write in one streaming pass
+                    phase = 'reuse' if reuse is not None else 'write' if prefetched is not None else 'copy'
+                    if duplicate is not None:
+                        phase = 'dedup'
+                        metrics.count('duplicates')
+                        metrics.count('duplicate_bytes', self.estimate.stats[file_path][0])
+                    finished = time.perf_counter()
+                    metrics.add_time(phase, finished - ready)
+                    stat = self.estimate.stats.get(file_path)
+                    metrics.file_done(os.path.relpath(file_path, self.root_directory), finished - start,
+                                      stat[0] if stat is not None else 0)
+                if self.resumable:
+                    journal.section_done(outfile, i - first + 1, record)
+            if self.stats:
+                self._fill_stats(outfile, files, records, widths, header_end, shard)
+        except BaseException:
+            journal.close()
+            output.abort(keep=self.resumable)
+            raise
+        finally:
+            if previous_output is not None:
+                previous_output.close()
+
+        start = time.perf_counter()
+        output.commit()
+        journal.remove()
+        if metrics is not None:
+            metrics.add_time('commit', time.perf_counter() - start)
+        return records
@@ -0,0 +1,205 @@
+"""
+Random access to combined files
+Reads the byte-offset index written next to a combined file, or rebuilds it
+with one pass over the output when the index is missing or stale, and pulls
+single sections out with a seek instead of scanning the whole file.
+"""
+
+import os
+import re
+import json
+import mmap
+
+# Sidecar index written by combine_engine when indexing is enabled
+INDEX_SUFFIX = '.index.json'
+INDEX_VERSION = 1
+
+# Size of the buffers used when copying sections out
+CHUNK_SIZE = 1024 * 1024
+
+# Written instead of the contents of a file that already appeared earlier
+# in the same output, when combining with deduplication
+DUPLICATE_NOTE = "[Same contents as {number}. {path}]"
+_DUPLICATE_PREFIX = DUPLICATE_NOTE.split("{")[0].encode('utf-8')
+_MAX_NOTE_BYTES = 8192
+
+# Content statistics after a table of contents entry, padded with blanks
+_STATS_SUFFIX = re.compile(r" \((?:\d+ lines, \d+(?:\.\d)? (?:bytes|KB|MB|GB), ~\d+ tokens|no statistics)\) *$")
+
+
+def index_path(output_file):
+    """Return the path of the byte-offset index kept next to output_file"""
+    return output_file + INDEX_SUFFIX
+
+
+def write_index(output_file, sections):
+    """
+    Record where each file's contents start in output_file and how many
+    bytes they take. sections is a list of dicts with path, offset, length.
+    """
+    stat = os.stat(output_file)
+    index = {
+        'version': INDEX_VERSION,
+        'output_size': stat.st_size,
+        'output_mtime_ns': stat.st_mtime_ns,
+        'sections': sections,
+    }
+    temp_path = index_path(output_file) + '.tmp'
+    with open(temp_path, 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+    os.replace(temp_path, index_path(output_file))
+
+
+def load_index(output_file):
+    """Return the sections of a valid index for output_file, or None"""
+    try:
+        with open(index_path(output_file), 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        stat = os.stat(output_file)
+    except (OSError, ValueError):
+        return None
+
+    if (index.get('version') != INDEX_VERSION
+            or index.get('output_size') != stat.st_size
+            or index.get('output_mtime_ns') != stat.st_mtime_ns):
+        return None
+    return index['sections']
+
+
+def _table_of_contents(data, newline):
+    """Return the relative paths listed in the TABLE OF CONTENTS, and where the list ends"""
+    start = data.find(b"TABLE OF CONTENTS" + newline)
+    if start == -1:
+        raise ValueError("Not a combined file: no TABLE OF CONTENTS")
+    # Skip the heading and the dashed line under it
+    pos = data.find(newline, start + len(b"TABLE OF CONTENTS") + len(newline)) + len(newline)
+    paths = []
+    while True:
+        end = data.find(newline, pos)
+        if end == -1 or end == pos:
+            return paths, pos
+        entry = data[pos:end].decode('utf-8')
+        number, _, rel_path = entry.partition(". ")
+        if not number.isdigit():
+            raise ValueError(f"Unexpected table of contents entry: {entry}")
+        paths.append(_STATS_SUFFIX.sub("", rel_path))
+        pos = end + len(newline)
+
+
+def scan_sections(data):
+    """
+    Find the sections of a combined file by scanning it once, for outputs
+    written without an index. data is a bytes-like object such as an mmap.
+    Each section is located by searching for the next header named in the
+    table of contents.
+    """
+    first_line = data.find(b"\n")
+    newline = b"\r\n" if first_line > 0 and data[first_line - 1:first_line] == b"\r" else b"\n"
+    paths, pos = _table_of_contents(data, newline)
+
+    headers = [b"(((" + rel_path.encode('utf-8') + b")))" + newline + newline for rel_path in paths]
+    separator = newline + newline
+    sections = []
+    pos = data.find(headers[0], pos) if headers else -1
+    for i, rel_path in enumerate(paths):
+        if pos == -1:
+            raise ValueError(f"Section not found: {rel_path}")
+        offset = pos + len(headers[i])
+        if i + 1 < len(paths):
+            pos = data.find(separator + headers[i + 1], offset)
+            end = pos
+            if pos != -1:
+                pos += len(separator)
+        else:
+            end = len(data) - len(separator)
+        sections.append({'path': rel_path, 'offset': offset, 'length': max(end - offset, 0)})
+    _resolve_duplicates(data, sections)
+    return sections
+
+
+def _resolve_duplicates(data, sections):
+    """Point sections that only hold a duplicate note at the bytes of the first copy"""
+    by_path = {}
+    for section in sections:
+        offset, length = section['offset'], section['length']
+        # A note is one short line naming an earlier section
+        if length <= _MAX_NOTE_BYTES and data[offset:offset + length].startswith(_DUPLICATE_PREFIX):
+            note = data[offset + len(_DUPLICATE_PREFIX):offset + length].decode('utf-8', 'replace')
+            _, _, first_path = note[:-1].partition(". ")
+            first_section = by_path.get(first_path) if note.endswith("]") else None
+            if first_section is not None:
+                section.update(offset=first_section['offset'], length=first_section['length'],
+                               duplicate_of=first_path)
+        by_path[section['path']] = section
+
+
+class CombinedReader:
+    """
+    Read-only view of a combined file with random access by relative path.
+    Section contents are returned as they appear in the output, i.e. UTF-8
+    with the output's newlines, including any truncation or binary notes.
+    Deduplicated sections return the contents of the copy they refer to.
+    """
+
+    def __init__(self, output_file):
+        self.output_file = output_file
+        self._file = open(output_file, 'rb')
+        self._data = b""
+        try:
+            size = os.fstat(self._file.fileno()).st_size
+            # mmap cannot map an empty file
+            if size:
+                self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+            sections = load_index(output_file)
+            if sections is None:
+                sections = scan_sections(self._data)
+        except BaseException:
+            self.close()
+            raise
+        self.sections = {section['path']: section for section in sections}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+    def paths(self):
+        """Return the relative paths of all sections, in output order"""
+        return list(self.sections)
+
+    def read(self, rel_path):
+        """Return the contents of one section as bytes"""
+        section = self.sections[rel_path]
+        return self._data[section['offset']:section['offset'] + section['length']]
+
+    def copy_to(self, rel_path, outfile):
+        """Copy one section into the binary file object outfile"""
+        section = self.sections[rel_path]
+        pos = section['offset']
+        end = pos + section['length']
+        while pos < end:
+            chunk = self._data[pos:min(pos + CHUNK_SIZE, end)]
+            outfile.write(chunk)
+            pos += len(chunk)
+
+    def extract(self, rel_path, directory):
+        """Write one section to its relative path under directory and return the new file's path"""
+        parts = rel_path.replace('\\', '/').split('/')
+        if os.path.isabs(rel_path) or '..' in parts:
+            raise ValueError(f"Refusing to extract outside the target directory: {rel_path}")
+        target = os.path.join(directory, *parts)
+        os.makedirs(os.path.dirname(target) or '.', exist_ok=True)
+        with open(target, 'wb') as f:
+            self.copy_to(rel_path, f)
+        return target
+
+    def extract_all(self, directory):
+        """Write every section under directory and return the new files' paths"""
+        return [self.extract(rel_path, directory) for rel_path in self.sections]
@@ -1,495 +1,286 @@
+"""
+File Combiner entry point
+Run without arguments to open the GUI, or pass a root directory to combine
+files headlessly:
+
+    python -m file_combiner ROOT -o combined.txt -i "*.py" -i "*.md"
+
+Files can be pulled back out of a combined file with:
+
+    python -m file_combiner extract combined.txt src/app.py -d restored
+
+Add --watch to keep the output up to date as files change, and many
+repositories can be combined in one go from a jobs file:
+
+    python -m file_combiner batch jobs.json -p 8
+"""
+
 import os
-import tkinter as tk
-from tkinter import filedialog, ttk
-from tkinter import messagebox
-import threading
-
-class FileCombinerApp:
-    def __init__(self, root):
-        self.root = root
-        self.root.title("File Combiner")
-        self.root.geometry("1000x700")  # Wider for dual-panel layout
-        self.root.minsize(800, 650)    # Set minimum window size
-        
-        # Variables
-        self.root_directory = ""
-        self.selected_files = []
-        self.output_file = ""
-        
-        # Create main frame
-        self.main_frame = ttk.Frame(root, padding="10")
-        self.main_frame.pack(fill=tk.BOTH, expand=True)
-        
-        # Create widgets
-        self.create_widgets()
-        
-    def create_widgets(self):
-        # Root directory selection
-        root_frame = ttk.LabelFrame(self.main_frame, text="Step 1: Select Root Directory", padding="10")
-        root_frame.pack(fill=tk.X, pady=5)
-        
-        self.root_dir_var = tk.StringVar()
-        ttk.Entry(root_frame, textvariable=self.root_dir_var, width=70).pack(side=tk.LEFT, padx=5)
-        ttk.Button(root_frame, text="Browse", command=self.select_root_directory).pack(side=tk.LEFT, padx=5)
-        
-        # File selection with dual panel layout
-        file_frame = ttk.LabelFrame(self.main_frame, text="Step 2: Select Files to Combine", padding="10")
-        file_frame.pack(fill=tk.BOTH, expand=True, pady=5)
-        
-        # Create a paned window for the split view
-        paned = ttk.PanedWindow(file_frame, orient=tk.HORIZONTAL)
-        paned.pack(fill=tk.BOTH, expand=True, pady=5)
-        
-        # Left panel - File browser tree
-        left_panel = ttk.Frame(paned)
-        paned.add(left_panel, weight=1)
-        
-        # Buttons for tree view
-        tree_btn_frame = ttk.Frame(left_panel)
-        tree_btn_frame.pack(fill=tk.X)
-        
-        ttk.Button(tree_btn_frame, text="Refresh", command=self.refresh_tree).pack(side=tk.LEFT, padx=5)
-        ttk.Button(tree_btn_frame, text="Expand All", command=lambda: self.expand_all_items(True)).pack(side=tk.LEFT, padx=5)
-        ttk.Button(tree_btn_frame, text="Collapse All", command=lambda: self.expand_all_items(False)).pack(side=tk.LEFT, padx=5)
-        
-        # Tree view with scrollbars
-        tree_container = ttk.Frame(left_panel)
-        tree_container.pack(fill=tk.BOTH, expand=True)
-        
-        # Add vertical scrollbar
-        vsb_tree = ttk.Scrollbar(tree_container, orient="vertical")
-        vsb_tree.pack(side=tk.RIGHT, fill=tk.Y)
-        
-        # Add horizontal scrollbar
-        hsb_tree = ttk.Scrollbar(tree_container, orient="horizontal")
-        hsb_tree.pack(side=tk.BOTTOM, fill=tk.X)
-        
-        # Create the tree view
-        self.tree = ttk.Treeview(tree_container)
-        self.tree.heading('#0', text='Files and Folders', anchor=tk.W)
-        self.tree.pack(fill=tk.BOTH, expand=True)
-        
-        # Connect scrollbars to treeview
-        self.tree.configure(yscrollcommand=vsb_tree.set, xscrollcommand=hsb_tree.set)
-        vsb_tree.configure(command=self.tree.yview)
-        hsb_tree.configure(command=self.tree.xview)
-        
-        # Bind events for tree
-        self.tree.bind("<Double-1>", self.toggle_item)
-        
-        # Center panel - Transfer buttons
-        center_panel = ttk.Frame(paned, width=50)  # Fixed width for button panel
-        paned.add(center_panel, weight=0)
-        
-        # Add padding around buttons
-        button_frame = ttk.Frame(center_panel, padding="10")
-        button_frame.pack(expand=True)
-        
-        # Add buttons for transferring items
-        ttk.Button(button_frame, text=">", command=self.add_selected, width=3).pack(pady=10)
-        ttk.Button(button_frame, text="<", command=self.remove_selected, width=3).pack(pady=10)
-        
-        # Right panel - Selected files list
-        right_panel = ttk.Frame(paned)
-        paned.add(right_panel, weight=1)
-        
-        # Button for clearing selection
-        ttk.Button(right_panel, text="Clear All", command=self.clear_selection).pack(anchor=tk.W, padx=5, pady=5)
-        
-        # Listbox with scrollbar for selected files
-        list_container = ttk.Frame(right_panel)
-        list_container.pack(fill=tk.BOTH, expand=True)
-        
-        vsb_list = ttk.Scrollbar(list_container, orient="vertical")
-        vsb_list.pack(side=tk.RIGHT, fill=tk.Y)
-        
-        self.selected_listbox = tk.Listbox(list_container, selectmode=tk.EXTENDED)
-        self.selected_listbox.pack(fill=tk.BOTH, expand=True)
-        self.selected_listbox.configure(yscrollcommand=vsb_list.set)
-        vsb_list.configure(command=self.selected_listbox.yview)
-        
-        # Set initial pane sizes (use the correct method names)
-        # ttk.PanedWindow doesn't support paneconfig, so we'll set the weights when adding them
-        # No need to call any additional methods here
-        
-        # Output file selection
-        output_frame = ttk.LabelFrame(self.main_frame, text="Step 3: Specify Output File", padding="10")
-        output_frame.pack(fill=tk.X, pady=5)
-        
-        self.output_var = tk.StringVar()
-        ttk.Entry(output_frame, textvariable=self.output_var, width=70).pack(side=tk.LEFT, padx=5)
-        ttk.Button(output_frame, text="Browse", command=self.select_output_file).pack(side=tk.LEFT, padx=5)
-        
-        # Combine button
-        combine_frame = ttk.LabelFrame(self.main_frame, text="Step 4: Combine Files", padding="10")
-        combine_frame.pack(fill=tk.X, pady=5)
-        
-        self.progress = ttk.Progressbar(combine_frame, orient=tk.HORIZONTAL, length=300, mode='determinate')
-        self.progress.pack(pady=10)
-        
-        self.combine_button = tk.Button(combine_frame, text="Combine Files", 
-                                      command=self.combine_files,
-                                      font=('Arial', 10),
-                                      bg='#e1e1e1',
-                                      height=1,
-                                      width=15)
-        self.combine_button.pack(pady=5)
-        
-        # Status label
-        self.status_var = tk.StringVar()
-        self.status_var.set("Ready")
-        ttk.Label(self.main_frame, textvariable=self.status_var, font=('Arial', 10)).pack(anchor=tk.W, pady=5)
-    
-    def select_root_directory(self):
-        directory = filedialog.askdirectory(title="Select Root Directory")
-        if directory:
-            self.root_directory = directory
-            self.root_dir_var.set(directory)
-            self.status_var.set(f"Root directory set to: {directory}")
-            
-            # Clear previous list and refresh tree
-            self.selected_files = []
-            self.selected_listbox.delete(0, tk.END)
-            self.refresh_tree()
-    
-    def refresh_tree(self):
-        if not self.root_directory:
-            messagebox.showwarning("Warning", "Please select a root directory first.")
-            return
-            
-        # Clear existing tree
-        for item in self.tree.get_children():
-            self.tree.delete(item)
-            
-        # Root node
-        root_node = self.tree.insert('', 'end', text=os.path.basename(self.root_directory), 
-                               open=True, values=[self.root_directory, "directory"])
-        
-        # Populate the tree
-        self.populate_tree(root_node, self.root_directory)
-        
-        # Expand the root node
-        self.tree.item(root_node, open=True)
-        
-    def populate_tree(self, parent, path, depth=1):
-        try:
-            # Skip certain directories to avoid clutter
-            skip_dirs = ['.git', '__pycache__', 'node_modules', '.vscode', '.idea']
-            
-            # List all items in the directory
-            items = sorted(os.listdir(path))
-            
-            # First add directories
-            for item in items:
-                item_path = os.path.join(path, item)
-                
-                # If it's a directory
-                if os.path.isdir(item_path) and item not in skip_dirs:
-                    # Insert the directory into the tree
-                    node = self.tree.insert(parent, 'end', text=item, 
-                                     values=[item_path, "directory"])
-                    
-                    # Only recurse if the depth is not too great (to avoid slowdown)
-                    if depth < 8:  # Limit recursion depth
-                        self.populate_tree(node, item_path, depth + 1)
-                    elif len(os.listdir(item_path)) > 0:
-                        # Add a placeholder if there are items but depth limit is reached
-                        self.tree.insert(node, 'end', text="...", values=["", "placeholder"])
-            
-            # Then add files
-            for item in items:
-                item_path = os.path.join(path, item)
-                
-                # If it's a file
-                if os.path.isfile(item_path):
-                    # Insert the file into the tree
-                    self.tree.insert(parent, 'end', text=item, 
-                                     values=[item_path, "file"])
-                    
-        except PermissionError:
-            # Add an error node if permission is denied
-            self.tree.insert(parent, 'end', text="Permission denied", values=["", "error"])
-        except Exception as e:
-            # Add an error node for any other exception
-            self.tree.insert(parent, 'end', text=f"Error: {str(e)}", values=["", "error"])
-    
-    def toggle_item(self, event):
-        """Toggle expand/collapse on double-click"""
-        item = self.tree.identify('item', event.x, event.y)
-        if item:
-            # Get type of item
-            values = self.tree.item(item, "values")
-            if len(values) >= 2:
-                item_type = values[1]
-                
-                # Only toggle directories
-                if item_type == "directory":
-                    if self.tree.item(item, "open"):
-                        self.tree.item(item, open=False)
-                    else:
-                        self.tree.item(item, open=True)
-                        
-                        # If this item has a placeholder, remove it and add actual items
-                        children = self.tree.get_children(item)
-                        if len(children) == 1 and self.tree.item(children[0], "values")[1] == "placeholder":
-                            self.tree.delete(children[0])
-                            item_path = self.tree.item(item, "values")[0]
-                            self.populate_tree(item, item_path)
-    
-    def add_selected(self):
-        """Add selected tree items to the right panel"""
-        selected_items = self.tree.selection()
-        
-        if not selected_items:
-            messagebox.showinfo("Information", "Please select files or folders in the left panel first.")
-            return
-            
-        # Process all selected items
-        for item in selected_items:
-            item_values = self.tree.item(item, "values")
-            item_path = item_values[0]
-            item_type = item_values[1]
-            
-            if item_type == "directory":
-                # If it's a directory, add all files in it recursively
-                self.add_directory_files(item_path)
-            elif item_type == "file":
-                # If it's a file, add it if not already in the list
-                if item_path not in self.selected_files:
-                    self.selected_files.append(item_path)
-                    rel_path = os.path.relpath(item_path, self.root_directory)
-                    self.selected_listbox.insert(tk.END, rel_path)
-        
-        # Update status
-        self.status_var.set(f"{len(self.selected_files)} files selected")
-    
-    def add_directory_files(self, directory):
-        """Add all files in a directory and its subdirectories"""
-        try:
-            for root, dirs, files in os.walk(directory):
-                # Skip certain directories to avoid clutter
-                dirs[:] = [d for d in dirs if d not in ['.git', '__pycache__', 'node_modules', '.vscode', '.idea']]
-                
-                # Add each file
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    if file_path not in self.selected_files:
-                        self.selected_files.append(file_path)
-                        rel_path = os.path.relpath(file_path, self.root_directory)
-                        self.selected_listbox.insert(tk.END, rel_path)
-        except Exception as e:
-            messagebox.showerror("Error", f"Error adding directory files: {str(e)}")
-    
-    def remove_selected(self):
-        """Remove selected items from the right panel"""
-        selected_indices = self.selected_listbox.curselection()
-        
-        if not selected_indices:
-            messagebox.showinfo("Information", "Please select files to remove in the right panel first.")
-            return
-            
-        # Remove items in reverse order to avoid index shifting
-        for i in sorted(selected_indices, reverse=True):
-            rel_path = self.selected_listbox.get(i)
-            full_path = os.path.join(self.root_directory, rel_path)
-            
-            # Remove from selected files list
-            if full_path in self.selected_files:
-                self.selected_files.remove(full_path)
-            
-            # Remove from listbox
-            self.selected_listbox.delete(i)
-        
-        # Update status
-        self.status_var.set(f"{len(self.selected_files)} files selected")
-    
-    def clear_selection(self):
-        """Clear all selected files"""
-        self.selected_files = []
-        self.selected_listbox.delete(0, tk.END)
-        self.status_var.set("Selection cleared")
-    
-    def expand_all_items(self, expand=True):
-        """Expand or collapse all items in the tree"""
-        def _expand_all(node):
-            for child in self.tree.get_children(node):
-                # Check if this is a directory
-                item_values = self.tree.item(child, "values")
-                if len(item_values) >= 2 and item_values[1] == "directory":
-                    self.tree.item(child, open=expand)
-                    
-                    # If expanding and this item has a placeholder, replace it
-                    if expand:
-                        children = self.tree.get_children(child)
-                        if len(children) == 1 and self.tree.item(children[0], "values")[1] == "placeholder":
-                            self.tree.delete(children[0])
-                            item_path = self.tree.item(child, "values")[0]
-                            self.populate_tree(child, item_path)
-                    
-                    # Recurse
-                    _expand_all(child)
-        
-        # Start recursion from the root
-        for child in self.tree.get_children():
-            self.tree.item(child, open=expand)
-            _expand_all(child)
-    
-    def select_output_file(self):
-        output_file = filedialog.asksaveasfilename(
-            title="Save Combined File As",
-            defaultextension=".txt",
-            filetypes=[("Text files", "*.txt"), ("All files", "*.*")]
+import sys
+import time
+import argparse
+
+import combine_engine
+import output_writer
+import instrumentation
+import tree_watcher
+from combined_reader import CombinedReader
+from path_filter import PathFilter
+
+
+def positive_int(text):
+    """argparse type for sizes and limits, where 0 could mean either nothing or no limit"""
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {value}")
+    return value
+
+
+def non_negative_int(text):
+    """argparse type for counts where 0 turns a feature off"""
+    value = int(text)
+    if value < 0:
+        raise argparse.ArgumentTypeError(f"must be 0 or more, got {value}")
+    return value
+
+
+def build_parser():
+    """Create the command line parser"""
+    parser = argparse.ArgumentParser(
+        prog="file_combiner",
+        description="Combine files from a directory tree into a single file."
+    )
+    parser.add_argument("root", help="Root directory used for relative paths")
+    parser.add_argument("-o", "--output", required=True, help="Path of the combined output file")
+    parser.add_argument("-i", "--include", action="append", default=[], metavar="GLOB",
+                        help="Only combine files matching this glob (can be repeated)")
+    parser.add_argument("-x", "--exclude", action="append", default=[], metavar="GLOB",
+                        help="Skip files and directories matching this glob (can be repeated)")
+    parser.add_argument("--no-gitignore", action="store_true",
+                        help="Do not honour .gitignore files")
+    parser.add_argument("-j", "--workers", type=non_negative_int, default=0,
+                        help="Prefetch and decode files on this many threads (default: sequential)")
+    parser.add_argument("--prefetch-mb", type=positive_int, default=combine_engine.DEFAULT_PREFETCH_BYTES // (1024 * 1024),
+                        help="Memory budget for prefetched file contents in MB (default: %(default)s)")
+    parser.add_argument("--max-file-kb", type=positive_int, metavar="KB",
+                        help="Keep at most this much of each file, as head and tail around a truncation marker")
+    parser.add_argument("--max-file-lines", type=positive_int, metavar="LINES",
+                        help="Keep at most this many lines of each file, as head and tail")
+    parser.add_argument("--max-total-mb", type=positive_int, metavar="MB",
+                        help="Stop copying file contents once this much input has been included")
+    parser.add_argument("--estimate", action="store_true",
+                        help="Only print the estimated output size and exit")
+    parser.add_argument("--compress", choices=sorted(output_writer.COMPRESSION_SUFFIXES),
+                        help="Compress the output (default: from the output suffix, .gz or .xz)")
+    parser.add_argument("--shard-mb", type=positive_int, metavar="MB",
+                        help="Split the output into shards of about this much file content, each with its own index")
+    parser.add_argument("--index", action="store_true",
+                        help="Write a byte-offset index of the sections next to the output")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Keep a manifest next to the output and only re-read files that changed since the last run")
+    parser.add_argument("--resume", action="store_true",
+                        help="Checkpoint finished files and continue an interrupted combine of the same files")
+    parser.add_argument("--watch", action="store_true",
+                        help="Keep running and update the output whenever files in the tree change")
+    parser.add_argument("--watch-interval", type=float, default=tree_watcher.POLL_SECONDS, metavar="SECONDS",
+                        help="Time between two checks for changes in watch mode (default: %(default)s)")
+    parser.add_argument("--dedup", action="store_true",
+                        help="Write files with identical contents once and refer back to the first copy")
+    parser.add_argument("--stats", action="store_true",
+                        help="List the lines, bytes and approximate tokens of each file in the table of contents")
+    parser.add_argument("--report", metavar="FILE",
+                        help="Write phase timings, counters and the slowest files as JSON to FILE")
+    parser.add_argument("--profile", metavar="FILE",
+                        help="Run under cProfile and dump the statistics to FILE")
+    return parser
+
+
+def build_extract_parser():
+    """Create the parser for the extract command"""
+    parser = argparse.ArgumentParser(
+        prog="file_combiner extract",
+        description="Extract files from a combined file. Uses the sidecar index when there is one."
+    )
+    parser.add_argument("combined", help="Combined file to read")
+    parser.add_argument("paths", nargs="*", help="Relative paths to extract (default: all files)")
+    parser.add_argument("-d", "--directory", default=".", help="Directory to extract into (default: current)")
+    parser.add_argument("-l", "--list", action="store_true", help="Only list the files in the combined file")
+    parser.add_argument("--stdout", action="store_true", help="Write the selected files to standard output")
+    return parser
+
+
+def run_cli(argv):
+    """Combine files from the command line and return an exit code"""
+    args = build_parser().parse_args(argv)
+    metrics = instrumentation.Metrics() if args.report else None
+    try:
+        if args.profile:
+            result = instrumentation.profile_call(args.profile, _combine, args, metrics)
+        else:
+            result = _combine(args, metrics)
+        if metrics is not None:
+            metrics.write_report(args.report)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    return result
+
+
+def _combine(args, metrics):
+    path_filter = PathFilter(args.root, include=args.include, exclude=args.exclude,
+                             use_gitignore=not args.no_gitignore)
+    # The DIRECTORY STRUCTURE shows the whole tree, not only the included files
+    snapshot = combine_engine.DirectorySnapshot(
+        PathFilter(args.root, exclude=args.exclude, use_gitignore=not args.no_gitignore))
+    # Leave out the output and the files written next to it, in case it is
+    # inside the root
+    ignore = combine_engine.output_paths(args.output)
+    if args.report:
+        ignore.append(os.path.abspath(args.report))
+    watcher = None
+    start = time.perf_counter()
+    if args.watch:
+        # The watcher's first walk doubles as the scan
+        watcher = tree_watcher.TreeWatcher(args.root, combine_engine.DirectorySnapshot(path_filter), ignore=ignore)
+        watcher.poll()
+        files = watcher.files()
+    else:
+        files = combine_engine.collect_files(args.root, path_filter=path_filter, ignore=ignore)
+    if metrics is not None:
+        metrics.add_time('scan', time.perf_counter() - start)
+    if not files:
+        print("No files matched.", file=sys.stderr)
+        return 1
+
+    budget = None
+    if args.max_file_kb is not None or args.max_file_lines is not None or args.max_total_mb is not None:
+        budget = combine_engine.OutputBudget(
+            max_file_bytes=args.max_file_kb * 1024 if args.max_file_kb is not None else None,
+            max_file_lines=args.max_file_lines,
+            max_total_bytes=args.max_total_mb * 1024 * 1024 if args.max_total_mb is not None else None,
         )
-        if output_file:
-            self.output_file = output_file
-            self.output_var.set(output_file)
-            self.status_var.set(f"Output file set to: {output_file}")
-    
-    def combine_files(self):
-        if not self.root_directory:
-            messagebox.showwarning("Warning", "Please select a root directory.")
-            return
-            
-        if not self.selected_files:
-            messagebox.showwarning("Warning", "Please select files to combine.")
-            return
-            
-        if not self.output_file:
-            messagebox.showwarning("Warning", "Please specify an output file.")
+
+    # Pre-flight estimate from a single stat pass
+    estimate = combine_engine.plan_output(files, budget, metrics)
+    print(f"Estimated: {estimate.describe()}")
+    if args.estimate:
+        return 0
+
+    compression = args.compress or output_writer.compression_for(args.output)
+    shard_bytes = args.shard_mb * 1024 * 1024 if args.shard_mb is not None else None
+    if args.watch and (compression is not None or shard_bytes is not None or args.resume or args.dedup):
+        print("--watch cannot be combined with compressed or sharded output, --resume or --dedup.", file=sys.stderr)
+        return 2
+
+    # Watch mode rewrites the output with incremental combines, so only
+    # the sections of changed files are read again
+    options = dict(workers=args.workers, prefetch_bytes=args.prefetch_mb * 1024 * 1024,
+                   incremental=args.incremental or args.watch, snapshot=snapshot, budget=budget,
+                   compression=compression, shard_bytes=shard_bytes, index=args.index,
+                   resumable=args.resume, metrics=metrics, dedup=args.dedup, stats=args.stats)
+    try:
+        combiner = combine_engine.Combiner(args.root, files, args.output, estimate=estimate, **options)
+    except ValueError as e:
+        # Combiner checks which options can be used together
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    total_files = combiner.run()
+    if combiner.resumed:
+        print(f"Resumed after {combiner.resumed} files from an interrupted run")
+    if combiner.duplicates:
+        print(f"{combiner.duplicates} files were duplicates of earlier ones and refer back to them")
+    if len(combiner.outputs) > 1:
+        print(f"Successfully combined {total_files} files into {len(combiner.outputs)} shards:")
+        for path in combiner.outputs:
+            print(f"  {path}")
+    else:
+        print(f"Successfully combined {total_files} files to {args.output}")
+    if args.stats:
+        print(f"Contents: {combiner.total_stats.describe()}")
+    if watcher is not None:
+        return _watch(args, watcher, budget, options)
+    return 0
+
+
+def _watch(args, watcher, budget, options):
+    """Update the output after every change to the tree until interrupted"""
+    def update(changes):
+        files = watcher.files()
+        if not files:
+            print("No files matched, output left unchanged.", file=sys.stderr)
             return
-        
-        # Start the combination process in a separate thread to avoid freezing the GUI
-        self.progress['value'] = 0
-        combine_thread = threading.Thread(target=self._combine_files_task)
-        combine_thread.daemon = True
-        combine_thread.start()
-    
-    def _generate_tree_view(self, directory, prefix="", is_last=True, exclude_dirs=None):
-        """Generate a tree view of the directory structure."""
-        if exclude_dirs is None:
-            exclude_dirs = ['.git', '__pycache__', 'node_modules', '.vscode', '.idea']
-            
-        lines = []
-        
-        # Get relative directory name for the current level
-        rel_dir = os.path.relpath(directory, self.root_directory)
-        if rel_dir == '.':
-            dir_name = os.path.basename(self.root_directory)
-        else:
-            dir_name = os.path.basename(directory)
-            
-        # Add this directory to the tree
-        if is_last:
-            lines.append(f"{prefix}└── {dir_name}/")
-            next_prefix = prefix + "    "
-        else:
-            lines.append(f"{prefix}├── {dir_name}/")
-            next_prefix = prefix + "│   "
-            
-        # Get all items in the directory
         try:
-            items = sorted(os.listdir(directory))
-            # First process directories, then files
-            dirs = [item for item in items if os.path.isdir(os.path.join(directory, item)) and item not in exclude_dirs]
-            files = [item for item in items if os.path.isfile(os.path.join(directory, item))]
-            
-            # Process directories
-            for i, item in enumerate(dirs):
-                item_path = os.path.join(directory, item)
-                is_last_dir = (i == len(dirs) - 1 and len(files) == 0)
-                lines.extend(self._generate_tree_view(item_path, next_prefix, is_last_dir, exclude_dirs))
-                
-            # Process files
-            for i, item in enumerate(files):
-                if i == len(files) - 1:  # Last item
-                    lines.append(f"{next_prefix}└── {item}")
+            estimate = combine_engine.plan_output(files, budget, options['metrics'])
+            combiner = combine_engine.Combiner(args.root, files, args.output, estimate=estimate, **options)
+            combiner.run()
+        except OSError as e:
+            print(f"Update failed: {e}", file=sys.stderr)
+            return
+        print(f"{time.strftime('%H:%M:%S')} {changes.describe()}: "
+              f"read {len(files) - combiner.reused} of {len(files)} files again")
+        if args.stats:
+            print(f"Contents: {combiner.total_stats.describe()}")
+
+    print(f"Watching {args.root} for changes, press Ctrl+C to stop")
+    try:
+        tree_watcher.watch(watcher, update, args.watch_interval)
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+def run_extract(argv):
+    """Extract files from a combined file and return an exit code"""
+    args = build_extract_parser().parse_args(argv)
+
+    try:
+        with CombinedReader(args.combined) as reader:
+            paths = args.paths or reader.paths()
+            missing = [path for path in paths if path not in reader.sections]
+            if missing:
+                for path in missing:
+                    print(f"Not in {args.combined}: {path}", file=sys.stderr)
+                return 1
+
+            for path in paths:
+                if args.list:
+                    print(path)
+                elif args.stdout:
+                    reader.copy_to(path, sys.stdout.buffer)
                 else:
-                    lines.append(f"{next_prefix}├── {item}")
-        except PermissionError:
-            lines.append(f"{next_prefix}[Permission denied]")
-        except Exception as e:
-            lines.append(f"{next_prefix}[Error: {str(e)}]")
-            
-        return lines
-        
-    def _combine_files_task(self):
-        try:
-            self.status_var.set("Combining files...")
-            total_files = len(self.selected_files)
-            
-            with open(self.output_file, 'w', encoding='utf-8') as outfile:
-                # Add file header with metadata
-                import datetime
-                current_date = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                
-                outfile.write("=" * 80 + "\n")
-                outfile.write("COMBINED FILE INDEX\n")
-                outfile.write("=" * 80 + "\n")
-                outfile.write(f"Created: {current_date}\n")
-                outfile.write(f"Root Directory: {self.root_directory}\n")
-                outfile.write(f"Number of Files: {total_files}\n\n")
-                
-                # Add tree view of the directory structure
-                outfile.write("DIRECTORY STRUCTURE\n")
-                outfile.write("-" * 80 + "\n")
-                
-                # Generate the tree view starting from the root directory
-                tree_lines = self._generate_tree_view(self.root_directory)
-                for line in tree_lines[1:]:  # Skip the first line (root dir with prefix)
-                    outfile.write(line + "\n")
-                outfile.write("\n")
-                
-                # Add table of contents with all selected files
-                outfile.write("TABLE OF CONTENTS\n")
-                outfile.write("-" * 80 + "\n")
-                for i, file_path in enumerate(self.selected_files):
-                    rel_path = os.path.relpath(file_path, self.root_directory)
-                    outfile.write(f"{i+1}. {rel_path}\n")
-                
-                # Add separator between header and content
-                outfile.write("\n" + "=" * 80 + "\n")
-                outfile.write("FILE CONTENTS\n")
-                outfile.write("=" * 80 + "\n\n")
-                
-                # Process each file
-                for i, file_path in enumerate(self.selected_files):
-                    # Update progress bar
-                    progress_value = int((i / total_files) * 100)
-                    self.root.after(0, lambda v=progress_value: self.progress.configure(value=v))
-                    
-                    # Get relative path
-                    rel_path = os.path.relpath(file_path, self.root_directory)
-                    
-                    # Write file header with the specified format
-                    outfile.write(f"((({rel_path})))\n\n")
-                    
-                    # Write file contents
-                    try:
-                        with open(file_path, 'r', encoding='utf-8') as infile:
-                            content = infile.read()
-                            outfile.write(content)
-                    except UnicodeDecodeError:
-                        # Try with a different encoding if UTF-8 fails
-                        try:
-                            with open(file_path, 'r', encoding='latin-1') as infile:
-                                content = infile.read()
-                                outfile.write(content)
-                        except Exception as e:
-                            outfile.write(f"[Error reading file: {str(e)}]")
-                    
-                    # Add separator between files
-                    outfile.write("\n\n")
-            
-            # Set progress to 100% when done
-            self.root.after(0, lambda: self.progress.configure(value=100))
-            self.root.after(0, lambda: self.status_var.set(f"Successfully combined {total_files} files to {self.output_file}"))
-            self.root.after(0, lambda: messagebox.showinfo("Success", f"Successfully combined {total_files} files to {self.output_file}"))
-            
-        except Exception as e:
-            self.root.after(0, lambda: self.status_var.set(f"Error: {str(e)}"))
-            self.root.after(0, lambda: messagebox.showerror("Error", f"An error occurred: {str(e)}"))
+                    print(reader.extract(path, args.directory))
+    except (OSError, ValueError) as e:
+        # Missing files, and files that are not uncompressed combined files
+        print(f"Cannot read {args.combined}: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def main(argv=None):
+    if argv is None:
+        argv = sys.argv[1:]
+
+    if argv and argv[0] == "extract":
+        return run_extract(argv[1:])
+    if argv and argv[0] == "batch":
+        import batch_runner
+        return batch_runner.main(argv[1:])
+    if argv:
+        return run_cli(argv)
+
+    # Only import tkinter when the GUI is actually requested
+    import file_combiner_gui
+    file_combiner_gui.main()
+    return 0
+
+
+def __getattr__(name):
+    # Keep "from file_combiner import FileCombinerApp" working
+    if name == "FileCombinerApp":
+        import file_combiner_gui
+        return file_combiner_gui.FileCombinerApp
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 if __name__ == "__main__":
-    root = tk.Tk()
-    app = FileCombinerApp(root)
-    root.mainloop()
\ No newline at end of file
+    sys.exit(main())
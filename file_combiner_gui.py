@@ -0,0 +1,1016 @@
+import os
+import tkinter as tk
+from tkinter import filedialog, ttk
+from tkinter import messagebox
+import threading
+import itertools
+import time
+
+import combine_engine
+import output_writer
+import instrumentation
+import tree_watcher
+import path_index
+from selection_model import SelectionModel
+from path_filter import PathFilter
+
+# Background scans hand results to the GUI in batches of this many entries,
+# or after this many seconds, whichever comes first
+SCAN_BATCH_SIZE = 500
+SCAN_BATCH_SECONDS = 0.1
+
+# Progress bar updates from the combine thread are coalesced to at most 30 per second
+PROGRESS_INTERVAL = 1 / 30
+
+# Phase names under which background scans show up in the timing report
+SCAN_PHASES = {"tree": "populate_tree", "select": "add_directory_files", "index": "index_paths"}
+
+# The filter runs once typing pauses for this many milliseconds
+FILTER_DELAY_MS = 150
+
+# At most this many matches are shown in the tree and in the selection list
+FILTER_DISPLAY_LIMIT = 1000
+
+# Timing report and cProfile dump written next to the output when requested
+REPORT_SUFFIX = ".report.json"
+PROFILE_SUFFIX = ".prof"
+
+class FileCombinerApp:
+    def __init__(self, root):
+        self.root = root
+        self.root.title("File Combiner")
+        self.root.geometry("1000x700")  # Wider for dual-panel layout
+        self.root.minsize(800, 650)    # Set minimum window size
+        
+        # Variables
+        self.root_directory = ""
+        self.selected_files = SelectionModel()
+        self.output_file = ""
+        
+        # Directory listings shared by the tree panel and the combined file header
+        self.snapshot = combine_engine.DirectorySnapshot()
+        
+        # Background scans: cancel event -> kind ("tree", "select" or "index")
+        self.active_scans = {}
+        self.loading_items = {}  # tree item -> cancel event of the scan loading it
+        self.scanned_count = 0
+        self.tree_ids = itertools.count(1)
+        
+        # Scan timings since the root directory was chosen, for the timing report
+        self.scan_metrics = instrumentation.Metrics()
+        
+        # Every file under the root and every selected file, for the filter
+        self.tree_index = path_index.PathIndex(self.root_directory)
+        self.selection_index = path_index.PathIndex(self.root_directory)
+        self.filter_job = None
+        # Tree roots detached while the tree shows matches instead
+        self.filter_roots = None
+        # Paths shown in the selection list while it is filtered, else None
+        self.visible_paths = None
+        
+        # Watch mode: one poll and one output update run in the background at a time
+        self.watcher = None
+        self.debouncer = None
+        self.watch_polling = False
+        self.watch_updating = False
+        self.watch_pending = False
+        # A manual combine is running; it and watch updates write the same partial output
+        self.combining = False
+        
+        # Create main frame
+        self.main_frame = ttk.Frame(root, padding="10")
+        self.main_frame.pack(fill=tk.BOTH, expand=True)
+        
+        # Create widgets
+        self.create_widgets()
+        
+    def create_widgets(self):
+        # Root directory selection
+        root_frame = ttk.LabelFrame(self.main_frame, text="Step 1: Select Root Directory", padding="10")
+        root_frame.pack(fill=tk.X, pady=5)
+        
+        self.root_dir_var = tk.StringVar()
+        ttk.Entry(root_frame, textvariable=self.root_dir_var, width=70).pack(side=tk.LEFT, padx=5)
+        ttk.Button(root_frame, text="Browse", command=self.select_root_directory).pack(side=tk.LEFT, padx=5)
+        
+        # File selection with dual panel layout
+        file_frame = ttk.LabelFrame(self.main_frame, text="Step 2: Select Files to Combine", padding="10")
+        file_frame.pack(fill=tk.BOTH, expand=True, pady=5)
+        
+        # Create a paned window for the split view
+        paned = ttk.PanedWindow(file_frame, orient=tk.HORIZONTAL)
+        paned.pack(fill=tk.BOTH, expand=True, pady=5)
+        
+        # Left panel - File browser tree
+        left_panel = ttk.Frame(paned)
+        paned.add(left_panel, weight=1)
+        
+        # Buttons for tree view
+        tree_btn_frame = ttk.Frame(left_panel)
+        tree_btn_frame.pack(fill=tk.X)
+        
+        ttk.Button(tree_btn_frame, text="Refresh", command=self.refresh_tree).pack(side=tk.LEFT, padx=5)
+        ttk.Button(tree_btn_frame, text="Expand All", command=lambda: self.expand_all_items(True)).pack(side=tk.LEFT, padx=5)
+        ttk.Button(tree_btn_frame, text="Collapse All", command=lambda: self.expand_all_items(False)).pack(side=tk.LEFT, padx=5)
+        
+        # Cancel button and live counter for background scans
+        self.cancel_button = ttk.Button(tree_btn_frame, text="Cancel", command=self.cancel_scans, state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.LEFT, padx=5)
+        self.scan_var = tk.StringVar()
+        ttk.Label(tree_btn_frame, textvariable=self.scan_var).pack(side=tk.LEFT, padx=5)
+        
+        # Filter for the tree and the selection list
+        filter_frame = ttk.Frame(left_panel)
+        filter_frame.pack(fill=tk.X, pady=5)
+        
+        ttk.Label(filter_frame, text="Filter:").pack(side=tk.LEFT, padx=5)
+        self.filter_var = tk.StringVar()
+        self.filter_var.trace_add("write", lambda *args: self.schedule_filter())
+        ttk.Entry(filter_frame, textvariable=self.filter_var, width=25).pack(side=tk.LEFT, padx=5, fill=tk.X, expand=True)
+        self.filter_mode_var = tk.StringVar(value=path_index.MODES[0])
+        filter_mode = ttk.Combobox(filter_frame, textvariable=self.filter_mode_var, values=path_index.MODES,
+                                   state="readonly", width=9)
+        filter_mode.pack(side=tk.LEFT, padx=5)
+        filter_mode.bind("<<ComboboxSelected>>", lambda event: self.apply_filter())
+        ttk.Button(filter_frame, text="Add All Matches", command=self.add_all_matches).pack(side=tk.LEFT, padx=5)
+        
+        # Tree view with scrollbars
+        tree_container = ttk.Frame(left_panel)
+        tree_container.pack(fill=tk.BOTH, expand=True)
+        
+        # Add vertical scrollbar
+        vsb_tree = ttk.Scrollbar(tree_container, orient="vertical")
+        vsb_tree.pack(side=tk.RIGHT, fill=tk.Y)
+        
+        # Add horizontal scrollbar
+        hsb_tree = ttk.Scrollbar(tree_container, orient="horizontal")
+        hsb_tree.pack(side=tk.BOTTOM, fill=tk.X)
+        
+        # Create the tree view
+        self.tree = ttk.Treeview(tree_container)
+        self.tree.heading('#0', text='Files and Folders', anchor=tk.W)
+        self.tree.pack(fill=tk.BOTH, expand=True)
+        
+        # Connect scrollbars to treeview
+        self.tree.configure(yscrollcommand=vsb_tree.set, xscrollcommand=hsb_tree.set)
+        vsb_tree.configure(command=self.tree.yview)
+        hsb_tree.configure(command=self.tree.xview)
+        
+        # Bind events for tree
+        self.tree.bind("<Double-1>", self.toggle_item)
+        self.tree.bind("<<TreeviewOpen>>", self.on_tree_open)
+        
+        # Center panel - Transfer buttons
+        center_panel = ttk.Frame(paned, width=50)  # Fixed width for button panel
+        paned.add(center_panel, weight=0)
+        
+        # Add padding around buttons
+        button_frame = ttk.Frame(center_panel, padding="10")
+        button_frame.pack(expand=True)
+        
+        # Add buttons for transferring items
+        ttk.Button(button_frame, text=">", command=self.add_selected, width=3).pack(pady=10)
+        ttk.Button(button_frame, text="<", command=self.remove_selected, width=3).pack(pady=10)
+        
+        # Right panel - Selected files list
+        right_panel = ttk.Frame(paned)
+        paned.add(right_panel, weight=1)
+        
+        # Button for clearing selection
+        ttk.Button(right_panel, text="Clear All", command=self.clear_selection).pack(anchor=tk.W, padx=5, pady=5)
+        
+        # Listbox with scrollbar for selected files
+        list_container = ttk.Frame(right_panel)
+        list_container.pack(fill=tk.BOTH, expand=True)
+        
+        vsb_list = ttk.Scrollbar(list_container, orient="vertical")
+        vsb_list.pack(side=tk.RIGHT, fill=tk.Y)
+        
+        self.selected_listbox = tk.Listbox(list_container, selectmode=tk.EXTENDED)
+        self.selected_listbox.pack(fill=tk.BOTH, expand=True)
+        self.selected_listbox.configure(yscrollcommand=vsb_list.set)
+        vsb_list.configure(command=self.selected_listbox.yview)
+        
+        # Set initial pane sizes (use the correct method names)
+        # ttk.PanedWindow doesn't support paneconfig, so we'll set the weights when adding them
+        # No need to call any additional methods here
+        
+        # Output file selection
+        output_frame = ttk.LabelFrame(self.main_frame, text="Step 3: Specify Output File", padding="10")
+        output_frame.pack(fill=tk.X, pady=5)
+        
+        self.output_var = tk.StringVar()
+        ttk.Entry(output_frame, textvariable=self.output_var, width=70).pack(side=tk.LEFT, padx=5)
+        ttk.Button(output_frame, text="Browse", command=self.select_output_file).pack(side=tk.LEFT, padx=5)
+        
+        # Combine button
+        combine_frame = ttk.LabelFrame(self.main_frame, text="Step 4: Combine Files", padding="10")
+        combine_frame.pack(fill=tk.X, pady=5)
+        
+        self.progress = ttk.Progressbar(combine_frame, orient=tk.HORIZONTAL, length=300, mode='determinate')
+        self.progress.pack(pady=10)
+        
+        self.combine_button = tk.Button(combine_frame, text="Combine Files", 
+                                      command=self.combine_files,
+                                      font=('Arial', 10),
+                                      bg='#e1e1e1',
+                                      height=1,
+                                      width=15)
+        self.combine_button.pack(pady=5)
+        
+        self.dedup_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(combine_frame, text="Write files with identical contents only once",
+                        variable=self.dedup_var).pack()
+        
+        self.stats_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(combine_frame, text="List lines, size and approximate tokens in the table of contents",
+                        variable=self.stats_var).pack()
+        
+        self.watch_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(combine_frame, text="Watch for changes and keep the output up to date",
+                        variable=self.watch_var, command=self.toggle_watch).pack()
+        
+        self.report_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(combine_frame, text="Write timing report and profile next to the output",
+                        variable=self.report_var).pack()
+        
+        # Status label
+        self.status_var = tk.StringVar()
+        self.status_var.set("Ready")
+        ttk.Label(self.main_frame, textvariable=self.status_var, font=('Arial', 10)).pack(anchor=tk.W, pady=5)
+    
+    def select_root_directory(self):
+        directory = filedialog.askdirectory(title="Select Root Directory")
+        if directory:
+            self.root_directory = directory
+            self.root_dir_var.set(directory)
+            self.status_var.set(f"Root directory set to: {directory}")
+            
+            # Clear previous list and refresh tree
+            self.cancel_scans()
+            self.stop_watch()
+            self.snapshot = combine_engine.DirectorySnapshot()
+            self.scan_metrics = instrumentation.Metrics()
+            self.selected_files.clear()
+            self.selection_index = path_index.PathIndex(directory)
+            self.selected_listbox.delete(0, tk.END)
+            self.visible_paths = None
+            self.refresh_tree()
+            self._filter_selection()
+    
+    def start_scan(self, kind, work, on_done=None):
+        """
+        Run work(cancel) on a background thread and return the cancel event.
+        on_done(cancelled) is called on the GUI thread when it finishes.
+        """
+        cancel = threading.Event()
+        if not self.active_scans:
+            self.scanned_count = 0
+        self.active_scans[cancel] = kind
+        self.cancel_button.configure(state=tk.NORMAL)
+        
+        scan_metrics = self.scan_metrics
+        
+        def run():
+            start = time.perf_counter()
+            try:
+                work(cancel)
+            finally:
+                scan_metrics.add_time(SCAN_PHASES[kind], time.perf_counter() - start)
+                self.root.after(0, self._finish_scan, cancel, on_done)
+        
+        scan_thread = threading.Thread(target=run)
+        scan_thread.daemon = True
+        scan_thread.start()
+        return cancel
+    
+    def _finish_scan(self, cancel, on_done):
+        del self.active_scans[cancel]
+        if not self.active_scans:
+            self.cancel_button.configure(state=tk.DISABLED)
+        if on_done is not None:
+            on_done(cancel.is_set())
+    
+    def cancel_scans(self, kind=None):
+        """Cancel running background scans, optionally only those of one kind"""
+        for cancel, scan_kind in self.active_scans.items():
+            if kind is None or scan_kind == kind:
+                cancel.set()
+    
+    def _count_scanned(self, count):
+        self.scanned_count += count
+        self.scan_metrics.count("tree_entries", count)
+        self.scan_var.set(f"{self.scanned_count} entries scanned")
+    
+    def refresh_tree(self):
+        if not self.root_directory:
+            messagebox.showwarning("Warning", "Please select a root directory first.")
+            return
+            
+        # Stop loading the old tree
+        self.cancel_scans("tree")
+        self.cancel_scans("index")
+        self.loading_items.clear()
+        
+        # Re-read .gitignore files, cached listings stay valid
+        self.snapshot.path_filter = PathFilter(self.root_directory)
+        
+        # Clear existing tree
+        self._restore_tree()
+        for item in self.tree.get_children():
+            self.tree.delete(item)
+            
+        # Root node, its contents load in the background
+        root_node = self.tree.insert('', 'end', text=os.path.basename(self.root_directory), 
+                               open=True, values=[self.root_directory, "directory"])
+        self.tree.insert(root_node, 'end', text="...", values=["", "placeholder"])
+        
+        # Populate the tree
+        self.load_children(root_node)
+        self.index_tree()
+    
+    def index_tree(self):
+        """Collect every file under the root for the filter, in the background"""
+        self.tree_index = path_index.PathIndex(self.root_directory)
+        tree_index = self.tree_index
+        
+        def scan(cancel):
+            batch = []
+            last_post = time.monotonic()
+            # Depth first in listing order, so matches show up in tree order
+            pending = [self.root_directory]
+            while pending and not cancel.is_set():
+                directory = pending.pop()
+                try:
+                    dirs, files = self.snapshot.list_directory(directory)
+                except OSError:
+                    continue
+                batch.extend(os.path.join(directory, name) for name in files)
+                pending.extend(os.path.join(directory, name) for name in reversed(dirs))
+                if len(batch) >= SCAN_BATCH_SIZE or time.monotonic() - last_post >= SCAN_BATCH_SECONDS:
+                    self.root.after(0, tree_index.add, batch)
+                    batch = []
+                    last_post = time.monotonic()
+            if batch:
+                self.root.after(0, tree_index.add, batch)
+        
+        def on_done(cancelled):
+            # Matches found while indexing were only the ones seen so far
+            if not cancelled and self.filter_var.get().strip():
+                self._filter_tree()
+        
+        self.start_scan("index", scan, on_done)
+        
+    def populate_tree(self, targets, recursive, cancel):
+        """
+        List directories on a background thread and post the tree changes in batches.
+        targets is a list of (item, path) for nodes whose placeholder gets replaced.
+        With recursive=True every subdirectory is loaded and opened as well.
+        """
+        pending = list(reversed(targets))
+        ops = []
+        count = 0
+        last_post = time.monotonic()
+        
+        while pending and not cancel.is_set():
+            parent, path = pending.pop()
+            subdirs = []
+            try:
+                # List the directory once, unchanged directories come from the snapshot
+                dirs, files = self.snapshot.list_directory(path)
+                
+                # First add directories
+                for item in dirs:
+                    item_path = os.path.join(path, item)
+                    node = f"scan{next(self.tree_ids)}"
+                    ops.append(("insert", parent, node, item, (item_path, "directory"), recursive))
+                    # Placeholder so the node can be opened, replaced on first open
+                    ops.append(("insert", node, node + ".placeholder", "...", ("", "placeholder"), False))
+                    subdirs.append((node, item_path))
+                
+                # Then add files
+                for item in files:
+                    ops.append(("insert", parent, "", item, (os.path.join(path, item), "file"), False))
+                count += len(dirs) + len(files)
+                    
+            except PermissionError:
+                # Add an error node if permission is denied
+                ops.append(("insert", parent, "", "Permission denied", ("", "error"), False))
+            except Exception as e:
+                # Add an error node for any other exception
+                ops.append(("insert", parent, "", f"Error: {str(e)}", ("", "error"), False))
+            
+            # The directory is complete once its placeholder is gone
+            ops.append(("loaded", parent))
+            if recursive:
+                pending.extend(reversed(subdirs))
+            
+            if len(ops) >= SCAN_BATCH_SIZE or time.monotonic() - last_post >= SCAN_BATCH_SECONDS:
+                self.root.after(0, self._apply_tree_ops, ops, count, cancel)
+                ops = []
+                count = 0
+                last_post = time.monotonic()
+        
+        if ops:
+            self.root.after(0, self._apply_tree_ops, ops, count, cancel)
+    
+    def _apply_tree_ops(self, ops, count, cancel):
+        """Apply a batch of tree changes from populate_tree"""
+        if cancel.is_set():
+            return
+        # Check each parent once per batch instead of once per inserted row
+        parents = {}
+        for op in ops:
+            if op[0] == "loaded":
+                item = op[1]
+                if self.tree.exists(item) and self.has_placeholder(item):
+                    self.tree.delete(self.tree.get_children(item)[0])
+                self.loading_items.pop(item, None)
+                continue
+            
+            _, parent, node, text, values, is_open = op
+            if parent not in parents:
+                parents[parent] = self.tree.exists(parent)
+            if parents[parent]:
+                if node:
+                    self.tree.insert(parent, 'end', iid=node, text=text, values=values, open=is_open)
+                    if is_open:
+                        # A recursive scan loads this directory later on
+                        self.loading_items[node] = cancel
+                else:
+                    self.tree.insert(parent, 'end', text=text, values=values)
+        self._count_scanned(count)
+    
+    def has_placeholder(self, item):
+        """Check whether a directory node still has to be loaded"""
+        children = self.tree.get_children(item)
+        return len(children) > 0 and self.tree.item(children[0], "values")[1] == "placeholder"
+    
+    def load_children(self, item, recursive=False):
+        """Replace the placeholder of a directory node with its contents in the background"""
+        self.load_tree([item], recursive)
+    
+    def load_tree(self, items, recursive=False):
+        """Load several directory nodes in a single background scan"""
+        targets = []
+        for item in items:
+            loading = self.loading_items.get(item)
+            if (loading is not None and not loading.is_set()) or not self.has_placeholder(item):
+                continue
+            # Drop children left over from an earlier cancelled load, keeping the placeholder
+            for child in self.tree.get_children(item)[1:]:
+                self.tree.delete(child)
+            targets.append((item, self.tree.item(item, "values")[0]))
+        
+        if not targets:
+            return
+        
+        cancel = self.start_scan("tree", lambda cancel: self.populate_tree(targets, recursive, cancel))
+        for item, _ in targets:
+            self.loading_items[item] = cancel
+    
+    def on_tree_open(self, event):
+        """Load a directory the first time it is opened"""
+        item = self.tree.focus()
+        if item:
+            self.load_children(item)
+    
+    def toggle_item(self, event):
+        """Toggle expand/collapse on double-click"""
+        item = self.tree.identify('item', event.x, event.y)
+        if item:
+            # Get type of item
+            values = self.tree.item(item, "values")
+            if len(values) >= 2:
+                item_type = values[1]
+                
+                # Only toggle directories
+                if item_type == "directory":
+                    if self.tree.item(item, "open"):
+                        self.tree.item(item, open=False)
+                    else:
+                        self.tree.item(item, open=True)
+                        
+                        # If this item has a placeholder, remove it and add actual items
+                        self.load_children(item)
+    
+    def add_selected(self):
+        """Add selected tree items to the right panel"""
+        selected_items = self.tree.selection()
+        
+        if not selected_items:
+            messagebox.showinfo("Information", "Please select files or folders in the left panel first.")
+            return
+            
+        # Process all selected items
+        directories = []
+        new_rows = []
+        for item in selected_items:
+            item_values = self.tree.item(item, "values")
+            item_path = item_values[0]
+            item_type = item_values[1]
+            
+            if item_type == "directory":
+                # If it's a directory, add all files in it recursively
+                directories.append(item_path)
+            elif item_type == "file":
+                # If it's a file, add it if not already in the list
+                if self.selected_files.add(item_path):
+                    new_rows.append(item_path)
+        
+        self._show_added(new_rows)
+        
+        if directories:
+            self.add_directory_files(*directories)
+        
+        # Update status
+        self.status_var.set(f"{len(self.selected_files)} files selected")
+    
+    def add_directory_files(self, *directories):
+        """Add all files in directories and their subdirectories, scanning in the background"""
+        path_filter = self.snapshot.path_filter
+        
+        def scan(cancel):
+            batch = []
+            last_post = time.monotonic()
+            try:
+                for directory in directories:
+                    for file_path in combine_engine.iter_directory_files(directory, path_filter=path_filter):
+                        if cancel.is_set():
+                            return
+                        batch.append(file_path)
+                        if len(batch) >= SCAN_BATCH_SIZE or time.monotonic() - last_post >= SCAN_BATCH_SECONDS:
+                            self.root.after(0, self._add_files_batch, batch, cancel)
+                            batch = []
+                            last_post = time.monotonic()
+            except Exception as e:
+                # e is unbound once the except block ends, so the message is bound now
+                self.root.after(0, lambda msg=str(e): messagebox.showerror("Error", f"Error adding directory files: {msg}"))
+            finally:
+                if batch:
+                    self.root.after(0, self._add_files_batch, batch, cancel)
+        
+        def on_done(cancelled):
+            if cancelled:
+                self.status_var.set(f"Scan cancelled, {len(self.selected_files)} files selected")
+            else:
+                self.status_var.set(f"{len(self.selected_files)} files selected")
+        
+        self.status_var.set("Adding files...")
+        self.start_scan("select", scan, on_done)
+    
+    def _add_files_batch(self, file_paths, cancel):
+        """Add a batch of files found by add_directory_files"""
+        if cancel.is_set():
+            return
+        self._show_added(self.selected_files.extend(file_paths))
+        self._count_scanned(len(file_paths))
+    
+    def _show_added(self, paths):
+        """Index newly selected files and list them, or filter again if the list is filtered"""
+        if not paths:
+            return
+        self.selection_index.add(paths)
+        if self.visible_paths is None:
+            # Insert all new rows with a single call
+            self.selected_listbox.insert(tk.END, *[os.path.relpath(p, self.root_directory) for p in paths])
+        else:
+            self.schedule_filter()
+    
+    def remove_selected(self):
+        """Remove selected items from the right panel"""
+        selected_indices = self.selected_listbox.curselection()
+        
+        if not selected_indices:
+            messagebox.showinfo("Information", "Please select files to remove in the right panel first.")
+            return
+            
+        if self.visible_paths is None:
+            self._remove_rows(selected_indices)
+        else:
+            # Rows of a filtered list are matches, not positions in the selection
+            paths = [self.visible_paths[row] for row in selected_indices]
+            for path in paths:
+                self.selected_files.discard(path)
+            self.selection_index.discard(paths)
+            self._filter_selection()
+        
+        # Update status
+        self.status_var.set(f"{len(self.selected_files)} files selected")
+    
+    def _remove_rows(self, rows):
+        """Remove rows from the selection and the listbox"""
+        # Remove from selected files, rows map directly to paths
+        self.selection_index.discard(self.selected_files.remove_rows(rows))
+        if self.visible_paths is not None:
+            self._filter_selection()
+            return
+        
+        # Remove runs of adjacent rows with one call each, last run first to avoid index shifting
+        runs = []
+        for i in sorted(rows):
+            if runs and runs[-1][1] == i - 1:
+                runs[-1][1] = i
+            else:
+                runs.append([i, i])
+        for first, last in reversed(runs):
+            self.selected_listbox.delete(first, last)
+    
+    def clear_selection(self):
+        """Clear all selected files"""
+        self.selected_files.clear()
+        self.selection_index.clear()
+        self.selected_listbox.delete(0, tk.END)
+        if self.visible_paths is not None:
+            self.visible_paths = []
+        self.status_var.set("Selection cleared")
+    
+    def schedule_filter(self):
+        """Filter once typing has paused, so each keystroke does not search on its own"""
+        if self.filter_job is not None:
+            self.root.after_cancel(self.filter_job)
+        self.filter_job = self.root.after(FILTER_DELAY_MS, self.apply_filter)
+    
+    def apply_filter(self):
+        """Show only the files matching the filter in the tree and in the selection list"""
+        if self.filter_job is not None:
+            self.root.after_cancel(self.filter_job)
+            self.filter_job = None
+        self._filter_tree()
+        self._filter_selection()
+    
+    def _search(self, index, limit):
+        try:
+            return index.search(self.filter_var.get().strip(), self.filter_mode_var.get(), limit)
+        except Exception as e:
+            self.status_var.set(f"Invalid filter: {str(e)}")
+            return []
+    
+    def _filter_tree(self):
+        """Replace the tree with a flat list of matching files, or bring it back without a filter"""
+        if not self.filter_var.get().strip():
+            self._restore_tree()
+            return
+        if self.filter_roots is None:
+            # Detached items keep their children and can still be loaded
+            self.filter_roots = self.tree.get_children()
+            self.tree.detach(*self.filter_roots)
+        else:
+            self.tree.delete(*self.tree.get_children())
+        
+        matches = self._search(self.tree_index, FILTER_DISPLAY_LIMIT + 1)
+        for path in matches[:FILTER_DISPLAY_LIMIT]:
+            self.tree.insert('', 'end', text=os.path.relpath(path, self.root_directory), values=(path, "file"))
+        if len(matches) > FILTER_DISPLAY_LIMIT:
+            self.tree.insert('', 'end', text=f"Showing the first {FILTER_DISPLAY_LIMIT} matches",
+                             values=("", "info"))
+        elif not matches:
+            self.tree.insert('', 'end', text="No matches", values=("", "info"))
+    
+    def _restore_tree(self):
+        """Drop the filter matches and put the detached tree back"""
+        if self.filter_roots is None:
+            return
+        self.tree.delete(*self.tree.get_children())
+        for position, item in enumerate(self.filter_roots):
+            self.tree.move(item, '', position)
+        self.filter_roots = None
+    
+    def _filter_selection(self):
+        """List only the matching selected files, or all of them without a filter"""
+        self.selected_listbox.delete(0, tk.END)
+        if self.filter_var.get().strip():
+            self.visible_paths = self._search(self.selection_index, FILTER_DISPLAY_LIMIT)
+            rows = self.visible_paths
+        else:
+            self.visible_paths = None
+            rows = self.selected_files
+        rows = [os.path.relpath(p, self.root_directory) for p in rows]
+        if rows:
+            self.selected_listbox.insert(tk.END, *rows)
+    
+    def add_all_matches(self):
+        """Add every file in the tree matching the filter, including those not shown"""
+        if not self.filter_var.get().strip():
+            messagebox.showinfo("Information", "Please enter a filter first.")
+            return
+        added = self.selected_files.extend(self._search(self.tree_index, None))
+        self._show_added(added)
+        status = f"{len(added)} files added, {len(self.selected_files)} files selected"
+        if any(kind == "index" for kind in self.active_scans.values()):
+            status += " (still scanning, more files may match)"
+        self.status_var.set(status)
+    
+    def expand_all_items(self, expand=True):
+        """Expand or collapse all items in the tree"""
+        unloaded = []
+        
+        def _expand_all(node):
+            for child in self.tree.get_children(node):
+                # Check if this is a directory
+                item_values = self.tree.item(child, "values")
+                if len(item_values) >= 2 and item_values[1] == "directory":
+                    self.tree.item(child, open=expand)
+                    
+                    # If expanding and this item has a placeholder, load it in the background
+                    if expand and self.has_placeholder(child):
+                        unloaded.append(child)
+                    else:
+                        # Recurse
+                        _expand_all(child)
+        
+        # Start recursion from the root
+        for child in self.tree.get_children():
+            self.tree.item(child, open=expand)
+            if expand and self.has_placeholder(child):
+                unloaded.append(child)
+            else:
+                _expand_all(child)
+        
+        if unloaded:
+            self.load_tree(unloaded, recursive=True)
+    
+    def select_output_file(self):
+        output_file = filedialog.asksaveasfilename(
+            title="Save Combined File As",
+            defaultextension=".txt",
+            filetypes=[("Text files", "*.txt"), ("Compressed text", "*.txt.gz *.txt.xz"), ("All files", "*.*")]
+        )
+        if output_file:
+            self.output_file = output_file
+            self.output_var.set(output_file)
+            self.status_var.set(f"Output file set to: {output_file}")
+    
+    def combine_files(self):
+        if not self.root_directory:
+            messagebox.showwarning("Warning", "Please select a root directory.")
+            return
+            
+        if not self.selected_files:
+            messagebox.showwarning("Warning", "Please select files to combine.")
+            return
+            
+        if not self.output_file:
+            messagebox.showwarning("Warning", "Please specify an output file.")
+            return
+        
+        if self.combining or self.watch_updating:
+            messagebox.showinfo("Information", "The output is being written, please wait until it is done.")
+            return
+        
+        # Start the combination process in a separate thread to avoid freezing the GUI
+        self.combining = True
+        self.progress['value'] = 0
+        combine_thread = threading.Thread(target=self._combine_files_task,
+                                          args=(self.report_var.get(), self.dedup_var.get(), self.stats_var.get()))
+        combine_thread.daemon = True
+        combine_thread.start()
+    
+    def _generate_tree_view(self, directory, prefix="", is_last=True, exclude_dirs=None):
+        """Generate a tree view of the directory structure."""
+        if exclude_dirs is not None:
+            return combine_engine.generate_tree_view(self.root_directory, directory, prefix, is_last, exclude_dirs)
+        return combine_engine.generate_tree_view(self.root_directory, directory, prefix, is_last,
+                                                 snapshot=self.snapshot)
+        
+    def _combine_files_task(self, write_report=False, dedup=False, stats=False):
+        try:
+            self.status_var.set("Combining files...")
+            # Snapshot the selection so it can keep changing while combining
+            files = list(self.selected_files)
+            total_files = len(files)
+            
+            last_update = [0.0]
+            
+            def update_progress(i, total):
+                # Update progress bar, at most PROGRESS_INTERVAL apart
+                now = time.monotonic()
+                if now - last_update[0] < PROGRESS_INTERVAL:
+                    return
+                last_update[0] = now
+                progress_value = int((i / total) * 100)
+                self.root.after(0, lambda v=progress_value: self.progress.configure(value=v))
+            
+            # Compressed outputs cannot be appended to, so only plain ones resume
+            compression = output_writer.compression_for(self.output_file)
+            
+            metrics = None
+            if write_report:
+                metrics = instrumentation.Metrics()
+                metrics.merge(self.scan_metrics)
+            
+            # Pre-flight size estimate from a single stat pass
+            estimate = combine_engine.plan_output(files, metrics=metrics)
+            self.root.after(0, lambda: self.status_var.set(f"Combining files... ({estimate.describe()})"))
+            
+            # Statistics are counted while the files are copied, no second pass over the output
+            combiner = combine_engine.Combiner(self.root_directory, files, self.output_file,
+                                               progress=update_progress, snapshot=self.snapshot, estimate=estimate,
+                                               compression=compression, resumable=compression is None,
+                                               metrics=metrics, dedup=dedup, stats=stats)
+            if write_report:
+                instrumentation.profile_call(self.output_file + PROFILE_SUFFIX, combiner.run)
+                metrics.write_report(self.output_file + REPORT_SUFFIX)
+            else:
+                combiner.run()
+            
+            # Set progress to 100% when done
+            done_message = f"Successfully combined {total_files} files to {self.output_file}"
+            if stats:
+                done_message += f" ({combiner.total_stats.describe()})"
+            if write_report:
+                done_message += f" (timing report: {self.output_file + REPORT_SUFFIX})"
+            self.root.after(0, lambda: self.progress.configure(value=100))
+            self.root.after(0, lambda: self.status_var.set(done_message))
+            self.root.after(0, lambda: messagebox.showinfo("Success", f"Successfully combined {total_files} files to {self.output_file}"))
+            
+        except Exception as e:
+            self.root.after(0, lambda msg=str(e): self.status_var.set(f"Error: {msg}"))
+            self.root.after(0, lambda msg=str(e): messagebox.showerror("Error", f"An error occurred: {msg}"))
+        finally:
+            self.root.after(0, self._combine_done)
+    
+    def _combine_done(self):
+        self.combining = False
+        # Changes seen while combining are written now
+        if self.watch_pending and self.watcher is not None:
+            self.watch_pending = False
+            self._start_watch_update()
+    
+    def toggle_watch(self):
+        if self.watch_var.get():
+            self.start_watch()
+        else:
+            self.stop_watch()
+    
+    def start_watch(self):
+        """Poll the tree for changes and keep the tree panel, the selection and the output up to date"""
+        if not self.root_directory:
+            self.watch_var.set(False)
+            messagebox.showwarning("Warning", "Please select a root directory first.")
+            return
+        if self.dedup_var.get():
+            # Updates reuse unchanged sections, which may be referred to by moved duplicates
+            self.watch_var.set(False)
+            messagebox.showwarning("Warning", "Watch mode cannot keep a deduplicated output up to date. "
+                                              "Untick the deduplication option first.")
+            return
+        self.watcher = tree_watcher.TreeWatcher(self.root_directory, self.snapshot)
+        self.debouncer = tree_watcher.Debouncer()
+        self.status_var.set(f"Watching {self.root_directory} for changes")
+        self._watch_tick(self.watcher)
+    
+    def stop_watch(self):
+        self.watcher = None
+        self.debouncer = None
+        self.watch_var.set(False)
+    
+    def _watch_tick(self, watcher):
+        """Start a background poll unless one is still running, and schedule the next tick"""
+        if watcher is not self.watcher:
+            return
+        if not self.watch_polling:
+            self.watch_polling = True
+            # Writing the output must not count as a change
+            watcher.ignore = (os.path.abspath(self.output_file),) if self.output_file else ()
+            # Snapshot the selection, it keeps changing while polling
+            files = list(self.selected_files)
+            
+            def poll():
+                try:
+                    changes = watcher.poll(files)
+                except Exception:
+                    changes = tree_watcher.TreeChanges()
+                self.root.after(0, self._watch_polled, watcher, changes)
+            
+            poll_thread = threading.Thread(target=poll)
+            poll_thread.daemon = True
+            poll_thread.start()
+        self.root.after(int(tree_watcher.POLL_SECONDS * 1000), self._watch_tick, watcher)
+    
+    def _watch_polled(self, watcher, changes):
+        self.watch_polling = False
+        if watcher is not self.watcher:
+            return
+        self.debouncer.add(changes)
+        changes = self.debouncer.ready()
+        if changes is not None:
+            self._apply_watch_changes(changes)
+    
+    def _apply_watch_changes(self, changes):
+        """Update the loaded parts of the tree and the selection, then the output if it is affected"""
+        for directory in sorted(changes.directories):
+            self._update_tree_directory(directory)
+        self.tree_index.discard(changes.removed)
+        self.tree_index.add(sorted(changes.added))
+        if self.filter_roots is not None and (changes.added or changes.removed):
+            self._filter_tree()
+        
+        rows = [row for row, path in enumerate(self.selected_files) if path in changes.removed]
+        if rows:
+            self._remove_rows(rows)
+        
+        # The header lists the whole tree, so any directory change affects the output
+        affected = changes.directories or rows or any(path in self.selected_files for path in changes.modified)
+        if affected and self.output_file and self.selected_files:
+            self._start_watch_update()
+        else:
+            self.status_var.set(f"Watching: {changes.describe()}")
+    
+    def _find_tree_item(self, path):
+        """Return the tree item of a loaded directory, or None"""
+        roots = self.tree.get_children() if self.filter_roots is None else self.filter_roots
+        if not roots:
+            return None
+        item = roots[0]
+        rel_path = os.path.relpath(path, self.root_directory)
+        if rel_path == '.':
+            return item
+        for part in rel_path.split(os.sep):
+            child_path = os.path.join(self.tree.item(item, "values")[0], part)
+            for child in self.tree.get_children(item):
+                if self.tree.item(child, "values")[0] == child_path:
+                    item = child
+                    break
+            else:
+                return None
+        return item
+    
+    def _update_tree_directory(self, directory):
+        """Bring the children of a loaded directory node in line with its listing"""
+        item = self._find_tree_item(directory)
+        if item is None or item in self.loading_items or self.has_placeholder(item):
+            return  # Not loaded yet, it is listed when it is opened
+        try:
+            dirs, files = self.snapshot.list_directory(directory)
+        except OSError:
+            return
+        wanted = [(os.path.join(directory, name), name, "directory") for name in dirs]
+        wanted += [(os.path.join(directory, name), name, "file") for name in files]
+        
+        existing = {}
+        for child in self.tree.get_children(item):
+            values = self.tree.item(child, "values")
+            existing[(values[0], values[1])] = child
+        keep = {(path, kind) for path, _, kind in wanted}
+        for key, child in existing.items():
+            if key not in keep:
+                self.tree.delete(child)
+        
+        # Insert in listing order, so every position is right once the earlier rows are in place
+        for position, (path, name, kind) in enumerate(wanted):
+            if (path, kind) in existing:
+                continue
+            if kind == "directory":
+                node = f"scan{next(self.tree_ids)}"
+                self.tree.insert(item, position, iid=node, text=name, values=(path, "directory"))
+                self.tree.insert(node, 'end', iid=node + ".placeholder", text="...", values=("", "placeholder"))
+            else:
+                self.tree.insert(item, position, text=name, values=(path, "file"))
+    
+    def _start_watch_update(self):
+        """Rewrite the output in the background, or once the running update or combine is done"""
+        if self.watch_updating or self.combining:
+            self.watch_pending = True
+            return
+        if self.dedup_var.get():
+            self.stop_watch()
+            self.status_var.set("Watch mode stopped, it cannot keep a deduplicated output up to date")
+            return
+        self.watch_updating = True
+        self.status_var.set("Updating output...")
+        update_thread = threading.Thread(target=self._watch_update_task,
+                                         args=(list(self.selected_files), self.output_file, self.stats_var.get()))
+        update_thread.daemon = True
+        update_thread.start()
+    
+    def _watch_update_task(self, files, output_file, stats=False):
+        try:
+            # Only files that changed are read again, the rest is copied from the previous output
+            compression = output_writer.compression_for(output_file)
+            combiner = combine_engine.Combiner(self.root_directory, files, output_file, snapshot=self.snapshot,
+                                               incremental=compression is None, compression=compression,
+                                               stats=stats)
+            combiner.run()
+            message = (f"Updated {output_file} at {time.strftime('%H:%M:%S')}: "
+                       f"read {len(files) - combiner.reused} of {len(files)} files again")
+            if stats:
+                message += f" ({combiner.total_stats.describe()})"
+        except Exception as e:
+            message = f"Error updating {output_file}: {str(e)}"
+        self.root.after(0, self._watch_update_done, message)
+    
+    def _watch_update_done(self, message):
+        self.watch_updating = False
+        self.status_var.set(message)
+        if self.watch_pending and self.watcher is not None:
+            self.watch_pending = False
+            self._start_watch_update()
+
+def main():
+    root = tk.Tk()
+    app = FileCombinerApp(root)
+    root.mainloop()
+
+if __name__ == "__main__":
+    main()
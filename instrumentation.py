@@ -0,0 +1,107 @@
+"""
+Timing and counters for File Combiner
+Collects how long each phase of a scan or combine takes, how many bytes and
+stat calls it needed and which files were slowest, and writes them out as a
+JSON report. Nothing is measured unless a Metrics object is passed in.
+"""
+
+import json
+import time
+import heapq
+import cProfile
+import threading
+from contextlib import contextmanager
+
+# Number of slowest files listed in a report
+DEFAULT_SLOWEST = 10
+
+
+class Metrics:
+    """Phase timings, counters and the slowest files of one run. Thread-safe."""
+
+    def __init__(self, slowest=DEFAULT_SLOWEST):
+        # phase name -> [total seconds, calls]
+        self.phases = {}
+        self.counters = {}
+        self.slowest = slowest
+        # Min-heap of (seconds, path, size) holding the slowest files
+        self._files = []
+        self._lock = threading.Lock()
+
+    def add_time(self, name, seconds, calls=1):
+        with self._lock:
+            phase = self.phases.setdefault(name, [0.0, 0])
+            phase[0] += seconds
+            phase[1] += calls
+
+    @contextmanager
+    def phase(self, name):
+        """Time the body of a with statement as one call of phase name"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+    def timed(self, name, func):
+        """Return func wrapped so every call is timed as phase name"""
+        def wrapper(*args, **kwargs):
+            with self.phase(name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    def count(self, name, amount=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def file_done(self, path, seconds, size):
+        """Record how long one file took, keeping only the slowest"""
+        with self._lock:
+            entry = (seconds, path, size)
+            if len(self._files) < self.slowest:
+                heapq.heappush(self._files, entry)
+            elif entry > self._files[0]:
+                heapq.heapreplace(self._files, entry)
+
+    def merge(self, other):
+        """Add the timings and counters of another Metrics, e.g. from a scan"""
+        with other._lock:
+            phases = dict(other.phases)
+            counters = dict(other.counters)
+            files = list(other._files)
+        for name, (seconds, calls) in phases.items():
+            self.add_time(name, seconds, calls)
+        for name, amount in counters.items():
+            self.count(name, amount)
+        for seconds, path, size in files:
+            self.file_done(path, seconds, size)
+
+    def report(self):
+        """Return the collected data as a JSON-serializable dict"""
+        with self._lock:
+            return {
+                'phases': {name: {'seconds': round(seconds, 6), 'calls': calls}
+                           for name, (seconds, calls) in sorted(self.phases.items())},
+                'counters': dict(sorted(self.counters.items())),
+                'slowest_files': [{'path': path, 'seconds': round(seconds, 6), 'bytes': size}
+                                  for seconds, path, size in sorted(self._files, reverse=True)],
+            }
+
+    def write_report(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, indent=2)
+
+
+def profile_call(profile_path, func, *args, **kwargs):
+    """
+    Run func under cProfile, dump the statistics to profile_path (readable
+    with pstats or snakeviz) and return func's result. Only the calling
+    thread is profiled, not the prefetching reader threads.
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        profiler.disable()
+        profiler.dump_stats(profile_path)
@@ -0,0 +1,322 @@
+"""
+Output writers for File Combiner
+Opens the combined output as plain text or as a gzip/xz compressed stream,
+and splits large combines into shards that each carry their own index
+header and table of contents. Outputs are written to a temporary file next
+to the destination and only renamed into place once complete, and a journal
+of finished sections lets an interrupted combine pick up where it stopped.
+"""
+
+import io
+import os
+import json
+import gzip
+import lzma
+import time
+
+# Compression formats and the file suffix each one is recognised by
+COMPRESSION_SUFFIXES = {'gzip': '.gz', 'xz': '.xz'}
+
+# Favour throughput over the last few percent of compression
+GZIP_LEVEL = 6
+XZ_PRESET = 6
+
+# Buffer in front of the compressor, so small writes are batched
+WRITE_BUFFER_SIZE = 1024 * 1024
+
+# An output is written to <output>.partial and renamed once it is complete
+PARTIAL_SUFFIX = '.partial'
+
+# Journal of finished sections for resumable combines. Checkpoints fsync the
+# partial output, so they are taken at most every CHECKPOINT_SECONDS.
+JOURNAL_SUFFIX = '.journal'
+JOURNAL_VERSION = 1
+CHECKPOINT_SECONDS = 1.0
+
+
+def compression_for(path):
+    """Return the compression format implied by a file name, or None"""
+    for compression, suffix in COMPRESSION_SUFFIXES.items():
+        if path.lower().endswith(suffix):
+            return compression
+    return None
+
+
+class _CompressedSink(io.RawIOBase):
+    """
+    Raw write-only stream feeding a gzip or lzma file object.
+    It is not seekable and flush() is a no-op: GzipFile.flush() would emit a
+    sync point every time the text layer flushes, which ruins compression.
+    """
+
+    def __init__(self, compressor):
+        self._compressor = compressor
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._compressor.write(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if not self.closed:
+            self._compressor.close()
+        super().close()
+
+
+def wrap_output(raw, compression=None, name=None):
+    """
+    Wrap the binary file raw for writing the combined output as UTF-8 text.
+    Compressed outputs are not seekable; the engine stages anything it may
+    have to roll back before it reaches them. Closing a compressed wrapper
+    writes the compressed trailer but leaves raw open.
+    """
+    if compression is None:
+        return io.TextIOWrapper(raw, encoding='utf-8')
+    if compression == 'gzip':
+        # The gzip header records the final file name, not the temporary one
+        compressor = gzip.GzipFile(name or '', 'wb', compresslevel=GZIP_LEVEL, fileobj=raw)
+    elif compression == 'xz':
+        compressor = lzma.LZMAFile(raw, 'wb', preset=XZ_PRESET)
+    else:
+        raise ValueError(f"Unknown compression: {compression}")
+    buffered = io.BufferedWriter(_CompressedSink(compressor), WRITE_BUFFER_SIZE)
+    return io.TextIOWrapper(buffered, encoding='utf-8')
+
+
+def _fsync_directory(directory):
+    """Make a rename in directory durable (not possible on Windows)"""
+    try:
+        fd = os.open(directory or '.', os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class AtomicOutput:
+    """
+    Writes an output file to path + PARTIAL_SUFFIX and moves it into place
+    with os.replace once it is complete and fsynced, so readers never see a
+    half-written output under the real name.
+    """
+
+    def __init__(self, path, compression=None):
+        self.path = path
+        self.temp_path = path + PARTIAL_SUFFIX
+        self.compression = compression
+        self._raw = None
+        self.text = None
+
+    def open(self, resume_at=None):
+        """
+        Open the temporary file and return the text stream to write to.
+        With resume_at the existing temporary file is cut back to that many
+        bytes and writing continues from there.
+        """
+        if resume_at is None:
+            self._raw = open(self.temp_path, 'wb')
+        else:
+            self._raw = open(self.temp_path, 'r+b')
+            self._raw.truncate(resume_at)
+            self._raw.seek(resume_at)
+        self.text = wrap_output(self._raw, self.compression, os.path.basename(self.path))
+        return self.text
+
+    def _close(self):
+        if self.compression is not None:
+            self.text.close()
+        else:
+            self.text.detach()
+        self._raw.flush()
+        os.fsync(self._raw.fileno())
+        self._raw.close()
+
+    def commit(self):
+        """Flush the output to disk and move it into place"""
+        self._close()
+        os.replace(self.temp_path, self.path)
+        _fsync_directory(os.path.dirname(self.path))
+
+    def abort(self, keep=False):
+        """Close the output after a failure, keeping the temporary file if it can be resumed"""
+        try:
+            if self.text is not None:
+                self._close()
+            elif self._raw is not None:
+                # Opened, but failed before the stream was wrapped
+                self._raw.close()
+        except (OSError, ValueError):
+            pass
+        if not keep:
+            try:
+                os.remove(self.temp_path)
+            except OSError:
+                pass
+
+
+class CombineJournal:
+    """
+    Journal of the sections already written to a partial output, one JSON
+    line per checkpoint after a header line identifying the combine. A
+    checkpoint is only written after the output has been fsynced up to it,
+    so everything the journal lists is on disk.
+    """
+
+    def __init__(self, output_file, job):
+        self.path = output_file + JOURNAL_SUFFIX
+        # Settings and file list the partial output was written with
+        self.job = job
+        self._file = None
+        self._pending = []
+        self._last_checkpoint = 0.0
+
+    def load(self):
+        """
+        Return (created, done, end, records) from an earlier run of the same
+        job: its creation time, the number of finished sections, the output
+        size after them and their section records. Returns None otherwise.
+        """
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                lines = f.read().split('\n')
+        except OSError:
+            return None
+        try:
+            header = json.loads(lines[0])
+        except ValueError:
+            return None
+        if header.get('version') != JOURNAL_VERSION or header.get('job') != self.job:
+            return None
+
+        done, end, records = 0, None, []
+        for line in lines[1:]:
+            try:
+                checkpoint = json.loads(line)
+            except ValueError:
+                break  # The last line may have been cut off by the crash
+            records.extend(checkpoint['records'])
+            done, end = checkpoint['done'], checkpoint['end']
+        if end is None:
+            return None
+        return header['created'], done, end, records
+
+    def start(self, created, done=0, end=None, records=()):
+        """Begin a new journal, carrying over the checkpoint being resumed from"""
+        self._file = open(self.path, 'w', encoding='utf-8')
+        self._file.write(json.dumps({'version': JOURNAL_VERSION, 'job': self.job, 'created': created}) + '\n')
+        if end is not None:
+            self._file.write(json.dumps({'done': done, 'end': end, 'records': list(records)}) + '\n')
+        self._sync()
+        self._last_checkpoint = time.monotonic()
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def section_done(self, outfile, done, record):
+        """Note a finished section and checkpoint if the last one is old enough"""
+        self._pending.append(record)
+        if time.monotonic() - self._last_checkpoint >= CHECKPOINT_SECONDS:
+            self.checkpoint(outfile, done)
+
+    def checkpoint(self, outfile, done):
+        """Fsync outfile and record that its first done sections are complete"""
+        if not self._pending:
+            return
+        outfile.flush()
+        os.fsync(outfile.fileno())
+        end = outfile.tell()
+        self._file.write(json.dumps({'done': done, 'end': end, 'records': self._pending}) + '\n')
+        self._sync()
+        self._pending = []
+        self._last_checkpoint = time.monotonic()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def remove(self):
+        """Delete the journal, once its output is complete or was started over"""
+        self.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+def _split_shard_name(output_file):
+    base, compressed = output_file, ''
+    if compression_for(output_file) is not None:
+        base, compressed = os.path.splitext(output_file)
+    base, ext = os.path.splitext(base)
+    return base, ext + compressed
+
+
+def shard_path(output_file, index):
+    """Return the path of shard index (0-based), e.g. combined.part002.txt.gz"""
+    base, ext = _split_shard_name(output_file)
+    return f"{base}.part{index + 1:03d}{ext}"
+
+
+def shard_prefix(output_file):
+    """Return the part every shard path of output_file starts with, e.g. combined.part"""
+    return _split_shard_name(output_file)[0] + '.part'
+
+
+class Shard:
+    """One output file of a sharded combine"""
+
+    def __init__(self, index, count, first, files, total_files):
+        self.index = index
+        self.count = count
+        # Position of files[0] in the full file list
+        self.first = first
+        self.files = files
+        self.total_files = total_files
+
+    def describe(self):
+        last = self.first + len(self.files)
+        return f"{self.index + 1} of {self.count} (files {self.first + 1}-{last} of {self.total_files})"
+
+
+def plan_shards(files, estimate, max_bytes):
+    """
+    Split files into shards of roughly max_bytes of file contents each,
+    keeping table of contents order. Sizes come from the estimate's stat
+    pass and budget limits; a file larger than max_bytes gets a shard of
+    its own. Returns a list of Shard.
+    """
+    groups = []
+    current = []
+    current_bytes = 0
+    for file_path in files:
+        stat = estimate.stats.get(file_path)
+        size = stat[0] if stat is not None else 0
+        limit = estimate.limits.get(file_path)
+        if limit is not None:
+            size = min(size, limit)
+        if current and current_bytes + size > max_bytes:
+            groups.append(current)
+            current = []
+            current_bytes = 0
+        current.append(file_path)
+        current_bytes += size
+    if current or not groups:
+        groups.append(current)
+
+    shards = []
+    first = 0
+    for index, group in enumerate(groups):
+        shards.append(Shard(index, len(groups), first, group, len(files)))
+        first += len(group)
+    return shards
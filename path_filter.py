@@ -0,0 +1,208 @@
+"""
+Include/exclude rules for File Combiner
+Compiles include and exclude globs once and honours nested .gitignore files.
+The tree panel, the file selection and the DIRECTORY STRUCTURE section all
+use the same PathFilter, and excluded directories are pruned before they are
+descended into.
+"""
+
+import os
+import re
+import fnmatch
+
+# Directories that are never shown or combined
+DEFAULT_EXCLUDE_DIRS = ['.git', '__pycache__', 'node_modules', '.vscode', '.idea']
+
+GITIGNORE_NAME = '.gitignore'
+
+# Match case-insensitively where the filesystem does
+_CASE_FLAGS = re.IGNORECASE if os.path.normcase('A') == 'a' else 0
+
+
+def compile_globs(patterns):
+    """
+    Compile glob patterns into a single test on relative paths.
+    Patterns without a slash match the file or directory name anywhere in
+    the tree, other patterns match the whole relative path ("/" separated).
+    Returns a function taking (rel_path, name), or None for no patterns.
+    """
+    name_parts = [fnmatch.translate(p) for p in patterns if '/' not in p]
+    path_parts = [fnmatch.translate(p) for p in patterns if '/' in p]
+    name_regex = re.compile('|'.join(name_parts), _CASE_FLAGS) if name_parts else None
+    path_regex = re.compile('|'.join(path_parts), _CASE_FLAGS) if path_parts else None
+
+    if name_regex is None and path_regex is None:
+        return None
+
+    def matches(rel_path, name):
+        if name_regex is not None and name_regex.match(name):
+            return True
+        return path_regex is not None and path_regex.match(rel_path) is not None
+
+    return matches
+
+
+def _translate_gitignore(pattern):
+    """Translate the body of a .gitignore pattern into a regular expression"""
+    parts = []
+    i = 0
+    n = len(pattern)
+    while i < n:
+        c = pattern[i]
+        if pattern.startswith('**/', i) and (i == 0 or pattern[i - 1] == '/'):
+            # Leading or inner "**/" matches zero or more directories
+            parts.append('(?:.*/)?')
+            i += 3
+        elif pattern.startswith('**', i) and i + 2 == n and (i == 0 or pattern[i - 1] == '/'):
+            # Trailing "**" matches everything inside
+            parts.append('.*')
+            i += 2
+        elif c == '*':
+            parts.append('[^/]*')
+            i += 1
+        elif c == '?':
+            parts.append('[^/]')
+            i += 1
+        elif c == '[':
+            end = pattern.find(']', i + 2 if pattern[i + 1:i + 2] in ('!', ']') else i + 1)
+            if end == -1:
+                parts.append(re.escape(c))
+                i += 1
+            else:
+                body = pattern[i + 1:end]
+                if body.startswith('!'):
+                    body = '^' + body[1:]
+                parts.append('[' + body.replace('\\', '\\\\') + ']')
+                i = end + 1
+        elif c == '\\' and i + 1 < n:
+            parts.append(re.escape(pattern[i + 1]))
+            i += 2
+        else:
+            parts.append(re.escape(c))
+            i += 1
+    return ''.join(parts)
+
+
+def parse_gitignore(lines):
+    """
+    Parse .gitignore lines into groups of rules.
+    Consecutive rules with the same (negate, dir_only) flags are combined
+    into one regex. Returns a list of (regex, negate, dir_only).
+    """
+    groups = []
+    for line in lines:
+        line = line.rstrip('\n').rstrip('\r')
+        # Trailing spaces are ignored unless escaped
+        while line.endswith(' ') and not line.endswith('\\ '):
+            line = line[:-1]
+        if not line or line.startswith('#'):
+            continue
+
+        negate = line.startswith('!')
+        if negate:
+            line = line[1:]
+        elif line.startswith('\\!') or line.startswith('\\#'):
+            line = line[1:]
+
+        dir_only = line.endswith('/')
+        line = line.rstrip('/')
+        if not line:
+            continue
+
+        # Patterns with a slash are relative to the .gitignore directory,
+        # others match a name at any depth below it
+        anchored = '/' in line
+        line = line.lstrip('/')
+        regex = _translate_gitignore(line)
+        if not anchored:
+            regex = '(?:.*/)?' + regex
+
+        if groups and groups[-1][1] == negate and groups[-1][2] == dir_only:
+            groups[-1][0].append(regex)
+        else:
+            groups.append(([regex], negate, dir_only))
+
+    return [(re.compile('^(?:' + '|'.join(parts) + ')$', _CASE_FLAGS), negate, dir_only)
+            for parts, negate, dir_only in groups]
+
+
+class PathFilter:
+    """Decides which files and directories under a root are shown and combined"""
+
+    def __init__(self, root_directory, include=None, exclude=None, exclude_dirs=None, use_gitignore=True):
+        self.root_directory = os.path.normpath(root_directory)
+        self.exclude_dirs = frozenset(DEFAULT_EXCLUDE_DIRS if exclude_dirs is None else exclude_dirs)
+        self._include = compile_globs(include or [])
+        self._exclude = compile_globs(exclude or [])
+        self.use_gitignore = use_gitignore
+        # directory -> (relative path, [(base, rules), ...] from the root down)
+        self._dir_info = {}
+
+    def _info(self, directory):
+        """Return the relative path and the .gitignore rules that apply inside directory"""
+        directory = os.path.normpath(directory)
+        info = self._dir_info.get(directory)
+        if info is not None:
+            return info
+
+        rel_dir = os.path.relpath(directory, self.root_directory)
+        if rel_dir == '.' or rel_dir.startswith('..'):
+            rel_dir = ''
+            rule_sets = []
+        else:
+            rel_dir = rel_dir.replace(os.sep, '/')
+            rule_sets = self._info(os.path.dirname(directory))[1]
+
+        if self.use_gitignore:
+            try:
+                with open(os.path.join(directory, GITIGNORE_NAME), 'r', encoding='utf-8', errors='replace') as f:
+                    rules = parse_gitignore(f)
+            except OSError:
+                rules = None
+            if rules:
+                rule_sets = rule_sets + [(rel_dir, rules)]
+
+        info = (rel_dir, rule_sets)
+        self._dir_info[directory] = info
+        return info
+
+    @staticmethod
+    def _ignored(rule_sets, rel_path, is_dir):
+        # Deeper .gitignore files and later lines win, so search backwards
+        for base, rules in reversed(rule_sets):
+            path = rel_path[len(base) + 1:] if base else rel_path
+            for regex, negate, dir_only in reversed(rules):
+                if dir_only and not is_dir:
+                    continue
+                if regex.match(path):
+                    return not negate
+        return False
+
+    def filter_listing(self, directory, dir_names, file_names):
+        """Filter the names listed in one directory, keeping their order"""
+        rel_dir, rule_sets = self._info(directory)
+        prefix = rel_dir + '/' if rel_dir else ''
+
+        dirs = []
+        for name in dir_names:
+            if name in self.exclude_dirs:
+                continue
+            rel_path = prefix + name
+            if self._exclude is not None and self._exclude(rel_path, name):
+                continue
+            if rule_sets and self._ignored(rule_sets, rel_path, True):
+                continue
+            dirs.append(name)
+
+        files = []
+        for name in file_names:
+            rel_path = prefix + name
+            if self._include is not None and not self._include(rel_path, name):
+                continue
+            if self._exclude is not None and self._exclude(rel_path, name):
+                continue
+            if rule_sets and self._ignored(rule_sets, rel_path, False):
+                continue
+            files.append(name)
+
+        return dirs, files
@@ -0,0 +1,186 @@
+"""
+Searchable path index for File Combiner
+Holds the relative paths of a tree (or of the selection) as a few large
+newline-joined strings, so a substring search is a handful of str.find
+calls over C-level buffers instead of a Python loop over every path. Paths
+are added in batches while scanning; batches are merged as they accumulate
+so the number of strings stays logarithmic in the number of paths.
+"""
+
+import os
+import re
+from bisect import bisect_right
+
+from path_filter import compile_globs
+
+MODES = ('substring', 'glob', 'fuzzy')
+
+# Fuzzy matches are ranked, so more of them are collected than returned
+FUZZY_CANDIDATES = 5000
+
+# Wildcards and bracket expressions, whatever is between them is literal
+_GLOB_SPECIAL = re.compile(r'\[[^\]]*\]|[*?\[\]]')
+
+
+class _Segment:
+    """A batch of paths as one lowercased, newline-joined string"""
+
+    def __init__(self, base, texts):
+        # Index of the first path in this segment
+        self.base = base
+        self.count = len(texts)
+        self.text = "\n".join(texts)
+        self.starts = []
+        pos = 0
+        for text in texts:
+            self.starts.append(pos)
+            pos += len(text) + 1
+
+    def merge(self, other):
+        """Append the paths of the segment added after this one"""
+        offset = len(self.text) + 1
+        self.starts.extend([start + offset for start in other.starts])
+        self.text = self.text + "\n" + other.text
+        self.count += other.count
+
+    def line(self, pos):
+        """Return (line number, start, end) of the line holding text offset pos"""
+        line = bisect_right(self.starts, pos) - 1
+        end = self.starts[line + 1] - 1 if line + 1 < self.count else len(self.text)
+        return line, self.starts[line], end
+
+
+class PathIndex:
+    """
+    Paths under root_directory, searchable by substring, glob or fuzzy
+    query on their "/" separated relative path. Searches ignore case and
+    return the original paths in the order they were added, except fuzzy
+    searches, which put the tightest matches first.
+    """
+
+    def __init__(self, root_directory):
+        self.root_directory = root_directory
+        self._prefix = os.path.join(root_directory, '')
+        self._paths = []
+        # path -> position in _paths, to skip duplicates and find removed paths
+        self._ids = {}
+        self._removed = set()
+        self._segments = []
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, path):
+        return path in self._ids
+
+    def _text(self, path):
+        if path.startswith(self._prefix):
+            rel_path = path[len(self._prefix):]
+        else:
+            rel_path = os.path.relpath(path, self.root_directory)
+        if os.sep != '/':
+            rel_path = rel_path.replace(os.sep, '/')
+        return rel_path.replace('\n', ' ').lower()
+
+    def add(self, paths):
+        """Add paths that are not in the index yet"""
+        texts = []
+        for path in paths:
+            if path in self._ids:
+                continue
+            self._ids[path] = len(self._paths)
+            self._paths.append(path)
+            texts.append(self._text(path))
+        if not texts:
+            return
+        self._segments.append(_Segment(len(self._paths) - len(texts), texts))
+        # Merge the newest segments while they are of similar size, like a binary counter
+        while len(self._segments) > 1 and self._segments[-2].count <= 2 * self._segments[-1].count:
+            last = self._segments.pop()
+            self._segments[-1].merge(last)
+
+    def discard(self, paths):
+        """Remove paths from the index"""
+        for path in paths:
+            path_id = self._ids.pop(path, None)
+            if path_id is not None:
+                self._removed.add(path_id)
+        # Rebuild once most of the index is dead weight
+        if len(self._removed) > len(self._ids):
+            paths = [path for path in self._paths if path in self._ids]
+            self.clear()
+            self.add(paths)
+
+    def clear(self):
+        self._paths = []
+        self._ids = {}
+        self._removed = set()
+        self._segments = []
+
+    def search(self, query, mode='substring', limit=None):
+        """
+        Return the paths matching query, at most limit of them. Substring
+        queries match anywhere in the relative path. Glob queries follow the
+        include/exclude rules: without a "/" they match the file name,
+        otherwise the whole relative path. Fuzzy queries match paths that
+        contain the query's characters in order.
+        """
+        query = query.lower()
+        if mode == 'substring':
+            ids = self._find(query, None, limit)
+        elif mode == 'glob':
+            matches = compile_globs([query])
+            # Only lines containing the longest literal part can match
+            literal = max(_GLOB_SPECIAL.split(query), key=len)
+            ids = self._find(literal, lambda line: matches(line, line.rpartition('/')[2]), limit)
+        elif mode == 'fuzzy':
+            return self._fuzzy(query, limit)
+        else:
+            raise ValueError(f"Unknown search mode: {mode}")
+        return [self._paths[path_id] for path_id in ids]
+
+    def _find(self, literal, accept, limit):
+        """Return the ids of lines containing literal that pass accept(line)"""
+        ids = []
+        for segment in self._segments:
+            if limit is None and accept is None:
+                # Everything is wanted: splitting once beats one find per match
+                ids.extend([segment.base + i for i, line in enumerate(segment.text.split("\n"))
+                            if literal in line and segment.base + i not in self._removed])
+                continue
+            text = segment.text
+            pos = text.find(literal)
+            while pos != -1:
+                line, start, end = segment.line(pos)
+                path_id = segment.base + line
+                if path_id not in self._removed and (accept is None or accept(text[start:end])):
+                    ids.append(path_id)
+                    if limit is not None and len(ids) >= limit:
+                        return ids
+                pos = text.find(literal, end + 1)
+        return ids
+
+    def _fuzzy(self, query, limit):
+        chars = [re.escape(char) for char in query if char != '\n']
+        if not chars:
+            return self.search('', 'substring', limit)
+        # Each character is followed by a run of anything but the next one,
+        # which finds the same lines as a lazy ".*?" without backtracking
+        pattern = re.compile(chars[0] + ''.join(f'[^\n{char}]*{char}' for char in chars[1:]))
+        # (span, length, id): tight matches in short paths first
+        found = []
+        for segment in self._segments:
+            if len(found) >= FUZZY_CANDIDATES:
+                break
+            text = segment.text
+            match = pattern.search(text)
+            while match is not None and len(found) < FUZZY_CANDIDATES:
+                line, start, end = segment.line(match.start())
+                path_id = segment.base + line
+                if path_id not in self._removed:
+                    found.append((match.end() - match.start(), end - start, path_id))
+                match = pattern.search(text, end + 1)
+        found.sort()
+        if limit is not None:
+            found = found[:limit]
+        return [self._paths[path_id] for _, _, path_id in found]
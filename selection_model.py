@@ -0,0 +1,70 @@
+"""
+Selection model for File Combiner
+Keeps the selected files in insertion order with O(1) membership, add and
+remove, and maps listbox rows back to paths.
+"""
+
+
+class SelectionModel:
+    """Insertion-ordered set of selected file paths"""
+
+    def __init__(self, paths=()):
+        # dicts keep insertion order, so the keys double as an ordered set
+        self._index = dict.fromkeys(paths)
+        # Row order snapshot, rebuilt lazily after removals
+        self._rows = None
+
+    def __len__(self):
+        return len(self._index)
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __contains__(self, path):
+        return path in self._index
+
+    def __bool__(self):
+        return bool(self._index)
+
+    def add(self, path):
+        """Add a path, returning False if it was already selected"""
+        if path in self._index:
+            return False
+        self._index[path] = None
+        if self._rows is not None:
+            self._rows.append(path)
+        return True
+
+    def extend(self, paths):
+        """Add several paths and return the ones that were not selected yet"""
+        added = []
+        for path in paths:
+            if self.add(path):
+                added.append(path)
+        return added
+
+    def discard(self, path):
+        """Remove a path, returning False if it was not selected"""
+        if path not in self._index:
+            return False
+        del self._index[path]
+        self._rows = None
+        return True
+
+    def path_at(self, row):
+        """Return the path shown at a listbox row"""
+        if self._rows is None:
+            self._rows = list(self._index)
+        return self._rows[row]
+
+    def remove_rows(self, rows):
+        """Remove the paths at the given listbox rows and return them"""
+        paths = [self.path_at(row) for row in rows]
+        for path in paths:
+            del self._index[path]
+        self._rows = None
+        return paths
+
+    def clear(self):
+        self._index.clear()
+        self._rows = None
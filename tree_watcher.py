@@ -0,0 +1,230 @@
+"""
+Change detection for watch mode
+Polls the root tree with one stat per directory and per watched file,
+comparing against the mtimes seen last time, and reports which files were
+added, removed or modified. Only directories whose mtime changed are listed
+again. Polling works the same on every platform and file system, network
+shares included, where inotify and friends do not.
+"""
+
+import os
+import time
+import threading
+
+from combine_engine import DirectorySnapshot
+from path_filter import PathFilter
+
+# Default time between two polls
+POLL_SECONDS = 1.0
+
+# Changes are reported once the tree has been quiet for this long, so a
+# checkout or a build touching many files leads to a single update
+DEBOUNCE_SECONDS = 0.5
+
+
+class TreeChanges:
+    """Files added, removed and modified since the last report, and the directories whose listing changed"""
+
+    def __init__(self):
+        self.added = set()
+        self.removed = set()
+        self.modified = set()
+        self.directories = set()
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.modified or self.directories)
+
+    def merge(self, other):
+        """Add the changes of a later poll"""
+        for path in other.removed:
+            if path in self.added:
+                self.added.discard(path)
+            else:
+                self.removed.add(path)
+            self.modified.discard(path)
+        for path in other.added:
+            if path in self.removed:
+                # Deleted and created again, e.g. by an editor saving through a temporary file
+                self.removed.discard(path)
+                self.modified.add(path)
+            else:
+                self.added.add(path)
+        self.modified |= other.modified - self.added
+        self.directories |= other.directories
+
+    def describe(self):
+        return f"{len(self.modified)} modified, {len(self.added)} added, {len(self.removed)} removed"
+
+
+class TreeWatcher:
+    """
+    Watches a root tree for files being added and removed, and a set of
+    files for changes to their size or mtime. Listings go through snapshot,
+    so the DIRECTORY STRUCTURE of the next combine reuses them. The first
+    poll walks the tree and reports nothing. Files whose absolute path
+    starts with one of the ignore prefixes are left out, e.g. an output written inside
+    the tree together with its sidecar files, which would otherwise
+    trigger another update every time it is written.
+    """
+
+    def __init__(self, root_directory, snapshot=None, ignore=()):
+        self.root_directory = root_directory
+        self.snapshot = snapshot or DirectorySnapshot(PathFilter(root_directory))
+        self.ignore = tuple(ignore)
+        # directory -> (mtime_ns, dirs, files) as seen by the last poll
+        self._listings = {}
+        # watched file -> (size, mtime_ns)
+        self._stats = {}
+        self._started = False
+
+    def files(self):
+        """Return every file in the tree, in the same order as collect_files on a sorted file system"""
+        files = []
+        pending = [self.root_directory]
+        while pending:
+            directory = pending.pop()
+            listing = self._listings.get(directory)
+            if listing is None:
+                continue
+            _, dirs, names = listing
+            files.extend(os.path.join(directory, name) for name in names)
+            pending.extend(os.path.join(directory, name) for name in reversed(dirs))
+        return files
+
+    def _list_directory(self, directory):
+        dirs, names = self.snapshot.list_directory(directory)
+        if self.ignore:
+            absolute = os.path.abspath(directory)
+            names = [name for name in names if not os.path.join(absolute, name).startswith(self.ignore)]
+        return dirs, names
+
+    def _list(self, directory, changes, report):
+        """List directory and everything below it, recording their files as added if report is set"""
+        pending = [directory]
+        while pending:
+            directory = pending.pop()
+            try:
+                mtime = os.stat(directory).st_mtime_ns
+                dirs, names = self._list_directory(directory)
+            except OSError:
+                continue
+            self._listings[directory] = (mtime, dirs, names)
+            if report:
+                changes.directories.add(directory)
+                changes.added.update(os.path.join(directory, name) for name in names)
+            pending.extend(os.path.join(directory, name) for name in dirs)
+
+    def _forget(self, directory, changes):
+        """Drop a removed directory and everything below it"""
+        pending = [directory]
+        while pending:
+            directory = pending.pop()
+            listing = self._listings.pop(directory, None)
+            if listing is None:
+                continue
+            _, dirs, names = listing
+            changes.removed.update(os.path.join(directory, name) for name in names)
+            pending.extend(os.path.join(directory, name) for name in dirs)
+
+    def poll(self, files=None):
+        """
+        Check the tree and the watched files and return a TreeChanges.
+        files are the files to watch for modifications, by default every
+        file in the tree. Files that start being watched are not reported.
+        """
+        changes = TreeChanges()
+        if not self._started:
+            self._list(self.root_directory, changes, report=False)
+            self._started = True
+
+        grace = time.time() - DirectorySnapshot.MTIME_GRACE_SECONDS
+        for directory, (mtime, dirs, names) in list(self._listings.items()):
+            if directory not in self._listings:
+                continue  # Its parent was removed earlier in this poll
+            try:
+                current = os.stat(directory).st_mtime_ns
+            except OSError:
+                parent = os.path.dirname(directory)
+                if parent in self._listings:
+                    changes.directories.add(parent)
+                self._forget(directory, changes)
+                continue
+            # A change within the same mtime tick would go unnoticed, so
+            # recently modified directories are listed again on every poll
+            if current == mtime and mtime / 1e9 < grace:
+                continue
+            try:
+                new_dirs, new_names = self._list_directory(directory)
+            except OSError:
+                continue
+            self._listings[directory] = (current, new_dirs, new_names)
+            if new_dirs == dirs and new_names == names:
+                continue
+
+            changes.directories.add(directory)
+            old_names, current_names = set(names), set(new_names)
+            changes.added.update(os.path.join(directory, name) for name in new_names if name not in old_names)
+            changes.removed.update(os.path.join(directory, name) for name in names if name not in current_names)
+            old_dirs, current_dirs = set(dirs), set(new_dirs)
+            for name in new_dirs:
+                if name not in old_dirs:
+                    self._list(os.path.join(directory, name), changes, report=True)
+            for name in dirs:
+                if name not in current_dirs:
+                    self._forget(os.path.join(directory, name), changes)
+
+        watched = self.files() if files is None else files
+        stats = {}
+        for file_path in watched:
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                if file_path in self._stats:
+                    changes.removed.add(file_path)
+                continue
+            stats[file_path] = (stat.st_size, stat.st_mtime_ns)
+            previous = self._stats.get(file_path)
+            if previous is not None and previous != stats[file_path]:
+                changes.modified.add(file_path)
+        self._stats = stats
+        changes.modified -= changes.added
+        return changes
+
+
+class Debouncer:
+    """Collects changes and hands them out once no new ones came in for debounce seconds"""
+
+    def __init__(self, debounce=DEBOUNCE_SECONDS):
+        self.debounce = debounce
+        self._pending = TreeChanges()
+        self._last_change = 0.0
+
+    def add(self, changes):
+        if changes:
+            self._pending.merge(changes)
+            self._last_change = time.monotonic()
+
+    def ready(self):
+        """Return the collected changes if the tree has been quiet long enough, else None"""
+        if not self._pending or time.monotonic() - self._last_change < self.debounce:
+            return None
+        changes = self._pending
+        self._pending = TreeChanges()
+        return changes
+
+
+def watch(watcher, on_change, interval=POLL_SECONDS, debounce=DEBOUNCE_SECONDS, stop=None):
+    """
+    Poll watcher every interval seconds and call on_change(changes) with
+    everything that changed once the tree has been quiet for debounce
+    seconds. Runs until the stop event is set.
+    """
+    if stop is None:
+        stop = threading.Event()
+    debouncer = Debouncer(debounce)
+    watcher.poll()
+    while not stop.wait(interval):
+        debouncer.add(watcher.poll())
+        changes = debouncer.ready()
+        if changes is not None:
+            on_change(changes)